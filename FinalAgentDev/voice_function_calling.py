@@ -2,7 +2,8 @@ from openai import AsyncOpenAI
 import asyncio
 from FinalAgentDev.functionalities import tools
 
-from OpenAIExample.audio_util import CHANNELS, SAMPLE_RATE
+from OpenAIExample.audio_util import MicCapture
+from OpenAIExample.event_router import EventRouter
 import base64
 
 
@@ -10,6 +11,13 @@ class RealtimeApp:
 
     def __init__(self):
         self.client = AsyncOpenAI()
+        self.connection = None
+        self.connected = asyncio.Event()
+        self.should_send_audio = asyncio.Event()
+        self.functionality = None
+
+        self.router = EventRouter()
+        self.router.subscribe("response.done", self.handle_response_done)
 
     async def on_mount(self) -> None:
         await self.handle_realtime_connection()
@@ -23,7 +31,9 @@ class RealtimeApp:
         """
 
         async with self.client.beta.realtime.connect(model="gpt-4o-realtime-preview-2024-10-01") as connection:
-            
+            self.connection = connection
+            self.connected.set()
+
             await connection.session.update(session={'modalities': ['audio']})
 
             await connection.session.update(session={"turn_detection": {"type": "server_vad"}})
@@ -62,28 +72,31 @@ class RealtimeApp:
                 await connection.response.create()
 
                 # Process the response
+                self.functionality = functionality
                 async for event in connection:
-                    if event.type == 'response.text.delta':
-                        # Ignore intermediate delta events
-                        continue
+                    await self.router.dispatch(event)
+                    if event.type == "response.done":
+                        break
 
-                    elif event.type == 'response.text.done':
-                        # Ignore completion event
-                        continue
+            print(f"Handler latency: {self.router.summary()}")
 
-                    elif event.type == "response.done":
-                        # Extract output for the specific functionality
-                        output_type = event.response.output[0].type
-                        output_name = event.response.output[0].name
-                        output_arguments = event.response.output[0].arguments
-                        call_id = event.response.output[0].call_id
-
-                        print(f"Functionality: {functionality['type']}")
-                        print(f"Output Type: {output_type}")
-                        print(f"Function Name: {output_name}")
-                        print(f"Arguments: {output_arguments}")
-                        print(f"Call ID: {call_id}")
-                        break
+    def handle_response_done(self, event) -> None:
+        # Extract output for the specific functionality
+        output_type = event.response.output[0].type
+        output_name = event.response.output[0].name
+        output_arguments = event.response.output[0].arguments
+        call_id = event.response.output[0].call_id
+
+        print(f"Functionality: {self.functionality['type']}")
+        print(f"Output Type: {output_type}")
+        print(f"Function Name: {output_name}")
+        print(f"Arguments: {output_arguments}")
+        print(f"Call ID: {call_id}")
+
+    async def _get_connection(self):
+        await self.connected.wait()
+        assert self.connection is not None
+        return self.connection
 
     async def send_mic_audio(self) -> None:
         import sounddevice as sd  # type: ignore
@@ -93,41 +106,24 @@ class RealtimeApp:
         device_info = sd.query_devices()
         print(device_info)
 
-        read_size = int(SAMPLE_RATE * 0.02)
-
-        stream = sd.InputStream(
-            channels=CHANNELS,
-            samplerate=SAMPLE_RATE,
-            dtype="int16",
-        )
-        stream.start()
-
-        status_indicator = self.query_one(AudioStatusIndicator)
-
         try:
-            while True:
-                if stream.read_available < read_size:
-                    await asyncio.sleep(0)
-                    continue
-
-                await self.should_send_audio.wait()
-                status_indicator.is_recording = True
-
-                data, _ = stream.read(read_size)
-
-                connection = await self._get_connection()
-                if not sent_audio:
-                    asyncio.create_task(connection.send({"type": "response.cancel"}))
-                    sent_audio = True
+            async with MicCapture() as mic:
+                async for data in mic:
+                    if not self.should_send_audio.is_set():
+                        sent_audio = False
+                        mic.release(data)
+                        continue
 
-                await connection.input_audio_buffer.append(audio=base64.b64encode(cast(Any, data)).decode("utf-8"))
+                    connection = await self._get_connection()
+                    if not sent_audio:
+                        asyncio.create_task(connection.send({"type": "response.cancel"}))
+                        sent_audio = True
 
-                await asyncio.sleep(0)
+                    audio = base64.b64encode(data).decode("utf-8")
+                    mic.release(data)
+                    await connection.input_audio_buffer.append(audio=audio)
         except KeyboardInterrupt:
             pass
-        finally:
-            stream.stop()
-            stream.close()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,114 @@
 import sqlite3
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from dataclasses import dataclass
+import threading
 import random
 import string
+import queue
+import time
 import re
 
+import numpy as np
+
+# Bumped with every schema change, `_create_tables` upgrades databases created by older versions
+SCHEMA_VERSION = 1
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384
+
+# The bookable 1-hour slots of a working day, 09:00-17:00 less the lunch hour. Bit i of a
+# day's mask in `SlotIndex` is set when the slot starting at SLOT_HOURS[i] is booked.
+SLOT_HOURS = (9, 10, 11, 13, 14, 15, 16)
+
+def configure_engine(connection, busy_timeout_ms=BUSY_TIMEOUT_MS, cache_size_kib=CACHE_SIZE_KIB):
+    """
+    Tune a connection for a single process with several reader and writer threads.
+
+    WAL lets readers run while a write is in progress and makes a commit an append to
+    the log; with `synchronous=NORMAL` commits no longer fsync, only checkpoints do, so
+    a power loss can drop the last commits but never corrupts the database. The busy
+    timeout makes a writer wait for the lock instead of failing with "database is locked".
+    Returns the journal mode in effect, in-memory databases stay in "memory".
+    """
+    journal_mode = connection.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    # a negative cache_size is in KiB rather than pages
+    connection.execute(f"PRAGMA cache_size = -{int(cache_size_kib)}")
+    return journal_mode
+
 class AppointmentDBHandler:
-    def __init__(self, db_name="hospital.db"):
-        """Initialize the database handler with the specified db name and create tables."""
-        self.connection = sqlite3.connect(db_name)  # Connect to SQLite database
+    def __init__(self, db_name="hospital.db", create_tables=True, check_same_thread=True, slot_cache=None, configure=True, slot_index=None, name_index=None):
+        """
+        Initialize the database handler with the specified db name and create tables.
+
+        Handlers shared between threads by `AppointmentDBPool` pass `check_same_thread=False`,
+        the pool makes sure only one thread uses a handler at a time. Handlers given a
+        `SlotCache` memoize free slots per doctor and day, and invalidate them on writes.
+        Handlers given a `SlotIndex` answer availability from its bitmaps instead, and
+        ignore the cache. Doctor names are resolved through `name_index`, a
+        `DoctorNameIndex` of their own when not given one.
+
+        Unless `configure` is False the connection is set up by `configure_engine`.
+        """
+        # the index is always current, a cache in front of it would only be invalidated
+        self.slot_cache = slot_cache if slot_index is None else None
+        self.slot_index = slot_index
+        self.name_index = name_index if name_index is not None else DoctorNameIndex()
+        self.connection = sqlite3.connect(db_name, check_same_thread=check_same_thread)  # Connect to SQLite database
+        if configure:
+            configure_engine(self.connection)
         self.cursor = self.connection.cursor()      # Create a cursor object for executing SQL queries
-        self._create_tables()                       # Create tables if they don't exist
+        self._transaction_depth = 0
+        self._changed_slots = []
+        self._changed_doctors = []
+        if create_tables:
+            self._create_tables()                   # Create tables if they don't exist
+
+    def ping(self) -> bool:
+        """
+        Health check, True when the connection still answers a trivial query.
+        """
+        try:
+            return self.connection.execute("SELECT 1").fetchone() == (1,)
+        except sqlite3.Error:
+            return False
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into one commit, e.g. the steps of a tool call.
+
+        The write lock is taken up front (BEGIN IMMEDIATE), so the reads inside the block
+        see no concurrent write between them and the writes that depend on them. Nested
+        blocks join the outermost one, which commits, or rolls back if it raises.
+        """
+        if self._transaction_depth == 0:
+            if self.connection.in_transaction:
+                self.connection.commit()
+            self.connection.execute("BEGIN IMMEDIATE")
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.connection.rollback()
+                self._flush_pending(committed=False)
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.connection.commit()
+                self._flush_pending(committed=True)
+
+    def _commit(self):
+        """Commit, unless the write is part of an open `transaction()` that commits at its end."""
+        if self._transaction_depth == 0:
+            self.connection.commit()
 
     def _create_tables(self):
         """Create tables if they do not exist."""
@@ -42,8 +141,33 @@ class AppointmentDBHandler:
             );
         """)
 
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._create_indexes()
+        if version < SCHEMA_VERSION:
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
         self.connection.commit()
 
+    def _create_indexes(self):
+        """Indexes for the patient and doctor lookups and the per doctor-day appointment queries."""
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_patients_name_contact ON patients (name, contact)
+        """)
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_patients_contact ON patients (contact)
+        """)
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_doctors_name_specialization ON doctors (name, specialization)
+        """)
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date ON appointments (doctor_id, appointment_date)
+        """)
+
     def add_patient(self, name, age, contact):
         self.cursor.execute("""
             SELECT patient_id FROM patients WHERE name = ? AND contact = ?
@@ -57,7 +181,7 @@ class AppointmentDBHandler:
             self.cursor.execute("""
                 INSERT INTO patients (patient_id, name, age, contact) VALUES (?, ?, ?, ?)
             """, (patient_id, name, age, contact))
-            self.connection.commit()
+            self._commit()
             return self.cursor.lastrowid
 
     def add_doctor(self, name, specialization):
@@ -73,9 +197,117 @@ class AppointmentDBHandler:
             self.cursor.execute("""
                 INSERT INTO doctors (doctor_id, name, specialization) VALUES (?, ?, ?)
             """, (doctor_id, name, specialization))
-            self.connection.commit()
+            self._commit()
+            self._doctors_changed((doctor_id, name, specialization))
             return self.cursor.lastrowid
 
+    def add_patients(self, patients) -> int:
+        """
+        Bulk version of `add_patient` for rosters, returns the number of patients inserted.
+
+        parameters:
+        - `patients`: iterable of (name, age, contact) -> rows already in the table, or
+          repeated within the batch, by (name, contact) are skipped
+        """
+        with self.transaction():
+            self.cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS import_patients (patient_id TEXT, name TEXT, age INTEGER, contact INTEGER)
+            """)
+            self.cursor.execute("DELETE FROM import_patients")
+            self.cursor.executemany("""
+                INSERT INTO import_patients (patient_id, name, age, contact) VALUES (?, ?, ?, ?)
+            """, ((_new_id(), name, age, contact) for name, age, contact in patients))
+
+            self.cursor.execute("""
+                INSERT INTO patients (patient_id, name, age, contact)
+                SELECT MIN(patient_id), name, MIN(age), contact
+                FROM import_patients AS new
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM patients WHERE patients.name = new.name AND patients.contact = new.contact
+                )
+                GROUP BY name, contact
+            """)
+            inserted = self.cursor.rowcount
+            self.cursor.execute("DELETE FROM import_patients")
+        return inserted
+
+    def add_doctors(self, doctors) -> int:
+        """
+        Bulk version of `add_doctor`, returns the number of doctors inserted.
+
+        parameters:
+        - `doctors`: iterable of (name, specialization) -> rows already in the table, or
+          repeated within the batch, are skipped
+        """
+        with self.transaction():
+            self.cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS import_doctors (doctor_id TEXT, name TEXT, specialization TEXT)
+            """)
+            self.cursor.execute("DELETE FROM import_doctors")
+            self.cursor.executemany("""
+                INSERT INTO import_doctors (doctor_id, name, specialization) VALUES (?, ?, ?)
+            """, ((_new_id(), name, specialization) for name, specialization in doctors))
+
+            self.cursor.execute("""
+                INSERT INTO doctors (doctor_id, name, specialization)
+                SELECT MIN(doctor_id), name, specialization
+                FROM import_doctors AS new
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM doctors WHERE doctors.name = new.name AND doctors.specialization = new.specialization
+                )
+                GROUP BY name, specialization
+            """)
+            inserted = self.cursor.rowcount
+            self.cursor.execute("DELETE FROM import_doctors")
+            if inserted:
+                self._doctors_changed()
+        return inserted
+
+    def add_appointments(self, appointments) -> int:
+        """
+        Backfill appointments, returns the number inserted.
+
+        parameters:
+        - `appointments`: iterable of (patient_id, doctor_id, appointment_date) -> dates in any
+          format `convert_to_standard_format` supports; rows with an unsupported date or for a
+          slot the doctor already has booked are skipped
+        """
+        rows = []
+        for patient_id, doctor_id, appointment_date in appointments:
+            appointment_date = convert_to_standard_format(appointment_date)
+            if appointment_date:
+                rows.append((_new_id(), patient_id, doctor_id, appointment_date))
+
+        with self.transaction():
+            self.cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS import_appointments (
+                    appointment_id TEXT, patient_id TEXT, doctor_id TEXT, appointment_date TEXT
+                )
+            """)
+            self.cursor.execute("DELETE FROM import_appointments")
+            self.cursor.executemany("""
+                INSERT INTO import_appointments (appointment_id, patient_id, doctor_id, appointment_date)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+
+            self.cursor.execute("""
+                INSERT INTO appointments (appointment_id, patient_id, doctor_id, appointment_date)
+                SELECT MIN(appointment_id), MIN(patient_id), doctor_id, appointment_date
+                FROM import_appointments AS new
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM appointments
+                    WHERE appointments.doctor_id = new.doctor_id AND appointments.appointment_date = new.appointment_date
+                )
+                GROUP BY doctor_id, appointment_date
+            """)
+            inserted = self.cursor.rowcount
+            self.cursor.execute("DELETE FROM import_appointments")
+
+            # rows skipped as duplicates are for slots that are booked already
+            for doctor_id, appointment_date in {(row[2], row[3]) for row in rows}:
+                self._slot_changed(doctor_id, appointment_date, booked=True)
+        return inserted
+
     def get_doctor_id(self, name: str, specialization: str) -> int:
 
         name = clean_doctor_name(name)
@@ -86,30 +318,61 @@ class AppointmentDBHandler:
 
         if result:
             return result[0]
-        else:
-            return None
+
+        # "Jon Smith" or just "Smith": take the closest name when it is a clear match
+        candidate = self.name_index.resolve(self, name, specialization)
+        return candidate.doctor_id if candidate else None
+
+    def find_doctors(self, name: str, specialization: str = None, limit: int = 5) -> list:
+        """
+        Doctors whose name is closest to `name`, best first, as `DoctorCandidate`s with a 0-1 score.
+
+        Parameters:
+        - `name`: str -> Name of the doctor as heard, e.g. "Dr. Jon Smith"
+        - `specialization`: str -> Only doctors of this specialization, when given
+        """
+        return self.name_index.search(self, name, specialization, limit)
 
     def get_available_appointments(self, doctor_name: str, specialization: str, date: str):
         """
         Get all available 1-hour appointment slots for a doctor on a given date.
         """
 
+        # a misheard name resolves to the doctor it was meant for, an unknown one is never added
+        doctor_id = self.get_doctor_id(name=doctor_name, specialization=specialization)
+        if doctor_id is None:
+            candidates = self.find_doctors(doctor_name, specialization, limit=3)
+            if not candidates:
+                return f"Doctor {doctor_name} with specialization {specialization} not found."
+            names = ", ".join(f"Dr. {candidate.name} ({candidate.specialization})" for candidate in candidates)
+            return f"Doctor {doctor_name} is ambiguous, did you mean: {names}?"
+
+        return self._available_slots_for(doctor_id, date)
+
+    def _available_slots_for(self, doctor_id: str, date: str) -> list:
+        """
+        Free 1-hour slots of a known doctor on `date` (YYYY-MM-DD), read-only.
+        """
+        if self.slot_index is not None:
+            return self.slot_index.free_slots(self, doctor_id, date)
+        if self.slot_cache is None:
+            return self._query_slots(doctor_id, date)
+        return self.slot_cache.get_or_compute(doctor_id, date, lambda: self._query_slots(doctor_id, date))
+
+    def _query_slots(self, doctor_id: str, date: str) -> list:
         # Define working hours and lunch break
         work_start = datetime.strptime(f"{date} 09:00:00", "%Y-%m-%d %H:%M:%S")
         work_end = datetime.strptime(f"{date} 17:00:00", "%Y-%m-%d %H:%M:%S")
         lunch_start = datetime.strptime(f"{date} 12:00:00", "%Y-%m-%d %H:%M:%S")
         lunch_end = datetime.strptime(f"{date} 13:00:00", "%Y-%m-%d %H:%M:%S")
 
-        doctor_id = self.add_doctor(name=doctor_name, specialization=specialization)
-
-        if not doctor_id:
-            return f"Doctor {doctor_name} with specialization {specialization} not found."
-
+        # a range over the day rather than LIKE 'date%', so the (doctor_id, appointment_date) index is used
+        next_date = (work_start + timedelta(days=1)).strftime("%Y-%m-%d")
         self.cursor.execute("""
             SELECT appointment_date
             FROM appointments
-            WHERE doctor_id = ? AND appointment_date LIKE ?
-        """, (doctor_id, f"{date}%"))
+            WHERE doctor_id = ? AND appointment_date >= ? AND appointment_date < ?
+        """, (doctor_id, date, next_date))
         scheduled_appointments = self.cursor.fetchall()
 
         scheduled_times = set(
@@ -169,23 +432,26 @@ class AppointmentDBHandler:
         appointment_id = appointment_id.upper()
         existing_appointment = self.get_appointment_by_id(appointment_id)
 
+        if not existing_appointment:
+            return f"Appointment with ID {appointment_id} does not exist."
+
         doctor_id = existing_appointment[1]
 
         formated_appointment_date = convert_to_standard_format(new_appointment_date)
-        if formated_appointment_date:
-            available_appointments = self.get_available_appointments(doctor_id, formated_appointment_date[:10])
-        else:
+        if not formated_appointment_date:
             return f"{new_appointment_date} -  is not supported"
 
-        if not any(appointment.strftime("%Y-%m-%d %H:%M:%S") == new_appointment_date for appointment in available_appointments):
+        if not self._slot_is_free(doctor_id, formated_appointment_date):
             return f"Doctor is not available at {new_appointment_date}."
 
         self.cursor.execute("""
             UPDATE appointments
             SET appointment_date = ?
             WHERE appointment_id = ? AND doctor_id = ?
-        """, (new_appointment_date, appointment_id, doctor_id))
-        self.connection.commit()
+        """, (formated_appointment_date, appointment_id, doctor_id))
+        self._commit()
+        self._slot_changed(doctor_id, existing_appointment[0], booked=False)
+        self._slot_changed(doctor_id, formated_appointment_date, booked=True)
 
         return f"Appointment has been successfully rescheduled to {new_appointment_date}."
 
@@ -194,7 +460,8 @@ class AppointmentDBHandler:
         patient_id: str,
         doctor_name: str,
         specialization: str,
-        appointment_date: str
+        appointment_date: str,
+        doctor_id: str = None
     ) -> str:
         """
         Check if a doctor is available on the given date and schedule an appointment.
@@ -204,15 +471,24 @@ class AppointmentDBHandler:
         - `doctor_name`: str -> Name of the doctor
         - `specializtion`: str -> Specialization of the doctor
         - `appointment_date`:str -> Date of the appointment
+        - `doctor_id`: str -> Id of the doctor, when it was already looked up
         """
 
-        try:
-            # Validate the date format using a utility function
-            appointment_date = convert_to_standard_format(appointment_date)
-        except ValueError:
-            return "Invalid date format. Use 'YYYY-MM-DD HH:MM:SS'."
-        
-        doctor_id = self.get_doctor_id(name=doctor_name, specialization=specialization)
+        # Validate the date format using a utility function
+        formated_appointment_date = convert_to_standard_format(appointment_date)
+        if not formated_appointment_date:
+            return f"{appointment_date} - is not a supported date. Use 'YYYY-MM-DD HH:MM:SS'."
+        appointment_date = formated_appointment_date
+
+        if doctor_id is None:
+            doctor_id = self.get_doctor_id(name=doctor_name, specialization=specialization)
+        if doctor_id is None:
+            candidates = self.find_doctors(doctor_name, specialization, limit=3)
+            if not candidates:
+                return f"Doctor {doctor_name} with specialization {specialization} not found."
+            # let the model ask the caller which one they meant instead of guessing
+            names = ", ".join(f"Dr. {candidate.name} ({candidate.specialization})" for candidate in candidates)
+            return f"Doctor {doctor_name} is ambiguous, did you mean: {names}?"
 
         self.cursor.execute("""
             SELECT COUNT(*)
@@ -231,10 +507,76 @@ class AppointmentDBHandler:
                     INSERT INTO appointments (appointment_id, patient_id, doctor_id, appointment_date)
                     VALUES (?, ?, ?, ?)
                 """, (appointment_id, patient_id, doctor_id, appointment_date))
-                self.connection.commit()
+                self._commit()
+                self._slot_changed(doctor_id, appointment_date, booked=True)
                 return f"Appointment scheduled successfully with ID {appointment_id} for Patient ID {patient_id} with Doctor ID {doctor_id} on {appointment_date}."
             except Exception as e:
                 return f"Failed to schedule appointment: {str(e)}"
+    def _slot_changed(self, doctor_id, appointment_date: str, booked: bool):
+        """Keep the slot cache and index in step with a committed, or pending, write."""
+        if self.slot_cache is not None:
+            self.slot_cache.invalidate(doctor_id, appointment_date[:10])
+        if self._transaction_depth:
+            # other handlers may cache the day from before the commit, and the index
+            # must not see writes that could still roll back: apply both again at the end
+            self._changed_slots.append((doctor_id, appointment_date, booked))
+        elif self.slot_index is not None:
+            self.slot_index.update(doctor_id, appointment_date, booked)
+
+    def _doctors_changed(self, doctor=None):
+        """Add a committed (doctor_id, name, specialization) to the name index, or reload it when None."""
+        if self._transaction_depth:
+            self._changed_doctors.append(doctor)
+        elif doctor is None:
+            self.name_index.invalidate()
+        else:
+            self.name_index.add(*doctor)
+
+    def _flush_pending(self, committed: bool):
+        changed, self._changed_slots = self._changed_slots, []
+        for doctor_id, appointment_date, booked in changed:
+            if self.slot_cache is not None:
+                self.slot_cache.invalidate(doctor_id, appointment_date[:10])
+            if committed and self.slot_index is not None:
+                self.slot_index.update(doctor_id, appointment_date, booked)
+
+        doctors, self._changed_doctors = self._changed_doctors, []
+        if committed:
+            for doctor in doctors:
+                self._doctors_changed(doctor)
+
+    def _slot_is_free(self, doctor_id, appointment_date: str) -> bool:
+        if self.slot_index is not None:
+            return self.slot_index.is_free(self, doctor_id, appointment_date)
+        return any(
+            slot.strftime("%Y-%m-%d %H:%M:%S") == appointment_date
+            for slot in self._available_slots_for(doctor_id, appointment_date[:10])
+        )
+
+    def find_earliest_slot(self, specialization: str, days: int = 14) -> str:
+        """
+        Find the earliest free slot with any doctor of a specialization.
+
+        Parameters:
+        - `specialization`: str -> The department or specialty, e.g. Cardiology
+        - `days`: int -> How many days ahead to search, starting today
+        """
+        self.cursor.execute("""
+            SELECT doctor_id, name FROM doctors WHERE specialization = ?
+        """, (specialization,))
+        doctors = dict(self.cursor.fetchall())
+        if not doctors:
+            return f"No doctors found with specialization {specialization}."
+
+        # handlers without a shared index still get the vectorized search, over a throwaway one
+        slot_index = self.slot_index if self.slot_index is not None else SlotIndex()
+        found = slot_index.earliest_free(self, list(doctors), datetime.now(), int(days))
+        if found is None:
+            return f"No {specialization} slots are available in the next {days} days."
+
+        doctor_id, slot = found
+        return f"Earliest available slot is with Dr. {doctors[doctor_id]} (Doctor ID {doctor_id}) on {slot.strftime('%Y-%m-%d %H:%M:%S')}."
+
     # Close the database connection
     def close(self):
         self.connection.close()
@@ -263,7 +605,8 @@ class AppointmentDBHandler:
             self.cursor.execute("""
                 DELETE FROM appointments WHERE appointment_id = ?
             """, (appointment_id,))
-            self.connection.commit()
+            self._commit()
+            self._slot_changed(appointment[2], appointment[3], booked=False)
 
             return f"Appointment with ID {appointment_id} has been successfully canceled."
         except Exception as e:
@@ -280,33 +623,555 @@ class AppointmentDBHandler:
 
 
 
+class SlotCache:
+    """
+    Free slots per (doctor_id, day), shared by the handlers of a pool.
+
+    Entries expire after `ttl_s` so writes made by other processes are picked up
+    eventually, and the least recently used entries are evicted past `max_entries`.
+    Writes through a handler invalidate the affected doctor-day straight away; a result
+    computed while an invalidation happened is returned but not stored, so a read racing
+    a write never caches the state from before it.
+    """
+
+    def __init__(self, ttl_s=60.0, max_entries=256):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidations = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get_or_compute(self, doctor_id, date, compute):
+        key = (doctor_id, date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                slots, stored_at = entry
+                if time.monotonic() - stored_at <= self.ttl_s:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(slots)
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            invalidations = self._invalidations
+
+        slots = compute()
+
+        with self._lock:
+            if invalidations == self._invalidations:
+                self._entries[key] = (tuple(slots), time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return slots
+
+    def invalidate(self, doctor_id, date):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop((doctor_id, date), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+def _slot_bit(appointment_date: str):
+    """Day ordinal and bit of a stored 'YYYY-MM-DD HH:MM:SS', None for times that aren't a slot start."""
+    try:
+        day = datetime.strptime(appointment_date[:10], "%Y-%m-%d").toordinal()
+        hour = int(appointment_date[11:13])
+    except ValueError:
+        return None
+    if appointment_date[13:] != ":00:00" or hour not in SLOT_HOURS:
+        return None
+    return day, 1 << SLOT_HOURS.index(hour)
+
+# slot index of the lowest clear bit of every day mask, len(SLOT_HOURS) when the day is full
+_FIRST_FREE = np.array(
+    [next((i for i in range(len(SLOT_HOURS)) if not mask >> i & 1), len(SLOT_HOURS)) for mask in range(256)],
+    dtype=np.int64,
+)
+
+class SlotIndex:
+    """
+    Booked-slot bitmaps per doctor, one uint8 mask per day, shared by the handlers of a pool.
+
+    A doctor's bookings are loaded with one indexed query the first time the doctor is
+    asked about, into a dense array of day masks, and reloaded after `ttl_s` to pick up
+    writes made by other processes. Writes through a handler set and clear bits once
+    they commit. A slot check or day listing is then a single array lookup, and a search
+    over many doctors and days is a handful of numpy operations on a (doctors, days) matrix.
+    """
+
+    def __init__(self, ttl_s=60.0):
+        self.ttl_s = ttl_s
+        self._doctors = {}  # doctor_id -> (first day ordinal, masks, loaded at)
+        self._lock = threading.Lock()
+        self._updates = 0
+
+        self.loads = 0
+
+    def _masks(self, handler, doctor_id):
+        with self._lock:
+            entry = self._doctors.get(doctor_id)
+            if entry is not None and time.monotonic() - entry[2] <= self.ttl_s:
+                return entry
+            updates = self._updates
+
+        handler.cursor.execute("""
+            SELECT appointment_date FROM appointments WHERE doctor_id = ?
+        """, (doctor_id,))
+        bits = [bit for (appointment_date,) in handler.cursor.fetchall() if (bit := _slot_bit(appointment_date))]
+        if bits:
+            days = np.array([day for day, _ in bits], dtype=np.int64)
+            first = int(days.min())
+            masks = np.zeros(int(days.max()) - first + 1, dtype=np.uint8)
+            np.bitwise_or.at(masks, days - first, np.array([bit for _, bit in bits], dtype=np.uint8))
+        else:
+            first, masks = 0, np.zeros(0, dtype=np.uint8)
+        entry = (first, masks, time.monotonic())
+
+        with self._lock:
+            self.loads += 1
+            # a write committed while loading may be missing from what was read
+            if updates == self._updates:
+                self._doctors[doctor_id] = entry
+        return entry
+
+    def _window(self, handler, doctor_id, first_day, days):
+        """Day masks of `doctor_id` for `days` days from the ordinal `first_day`."""
+        first, masks, _ = self._masks(handler, doctor_id)
+        window = np.zeros(days, dtype=np.uint8)
+        start, end = max(first_day, first), min(first_day + days, first + len(masks))
+        if start < end:
+            window[start - first_day:end - first_day] = masks[start - first:end - first]
+        return window
+
+    def update(self, doctor_id, appointment_date: str, booked: bool):
+        with self._lock:
+            self._updates += 1
+            entry = self._doctors.get(doctor_id)
+            slot = _slot_bit(appointment_date)
+            if entry is None or slot is None:
+                return
+            day, bit = slot
+            first, masks, loaded_at = entry
+            if len(masks) == 0:
+                first = day
+            if not first <= day < first + len(masks):
+                start, end = min(first, day), max(first + len(masks), day + 1)
+                grown = np.zeros(end - start, dtype=np.uint8)
+                grown[first - start:first - start + len(masks)] = masks
+                first, masks = start, grown
+            if booked:
+                masks[day - first] |= bit
+            else:
+                masks[day - first] &= ~bit & 0xFF
+            self._doctors[doctor_id] = (first, masks, loaded_at)
+
+    def is_free(self, handler, doctor_id, appointment_date: str) -> bool:
+        slot = _slot_bit(appointment_date)
+        if slot is None:
+            return False
+        day, bit = slot
+        return not self._window(handler, doctor_id, day, 1)[0] & bit
+
+    def free_slots(self, handler, doctor_id, date: str) -> list:
+        day = datetime.strptime(date, "%Y-%m-%d")
+        mask = int(self._window(handler, doctor_id, day.toordinal(), 1)[0])
+        return [day.replace(hour=hour) for i, hour in enumerate(SLOT_HOURS) if not mask >> i & 1]
+
+    def earliest_free(self, handler, doctor_ids, not_before: datetime, days: int):
+        """
+        The (doctor_id, slot start) of the earliest free slot of any of `doctor_ids` within
+        `days` days of `not_before`, slots starting before `not_before` excluded. Ties go to
+        the doctor listed first. None when every slot is booked.
+        """
+        if not doctor_ids or days <= 0:
+            return None
+        first_day = not_before.toordinal()
+        booked = np.stack([self._window(handler, doctor_id, first_day, days) for doctor_id in doctor_ids])
+
+        # slots of the first day that have already started count as booked
+        started = sum(1 << i for i, hour in enumerate(SLOT_HOURS) if (hour, 0) < (not_before.hour, not_before.minute))
+        booked[:, 0] |= started
+
+        first_free = _FIRST_FREE[booked]                          # (doctors, days)
+        key = np.arange(days) * (len(SLOT_HOURS) + 1) + first_free  # orders by day, then hour
+        key[first_free == len(SLOT_HOURS)] = np.iinfo(np.int64).max
+        doctor, day = np.unravel_index(np.argmin(key), key.shape)
+        if key[doctor, day] == np.iinfo(np.int64).max:
+            return None
+
+        slot_day = datetime.fromordinal(first_day + int(day))
+        return doctor_ids[int(doctor)], slot_day.replace(hour=SLOT_HOURS[int(first_free[doctor, day])])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"doctors": len(self._doctors), "loads": self.loads, "updates": self._updates}
+
+
+AUTO_RESOLVE_SCORE = 0.7
+AUTO_RESOLVE_MARGIN = 0.15
+MIN_CANDIDATE_SCORE = 0.3
+NAME_SEARCH_CANDIDATES = 64
+
+def _normalize_name(name: str) -> str:
+    name = clean_doctor_name(name or "").lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name).split())
+
+def _trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+@dataclass
+class DoctorCandidate:
+    """
+    A doctor matching a spoken name, `score` is 1.0 for an exact match of the name.
+    """
+    doctor_id: str
+    name: str
+    specialization: str
+    score: float
+
+class DoctorNameIndex:
+    """
+    Trigram index over the names in the `doctors` table, for names as the model hears them.
+
+    A name scores the better of its trigram similarity to the full name and the average,
+    over its words, of each word's best similarity to a word of the name, so a surname on
+    its own matches as well as a misspelt full name. Only the NAME_SEARCH_CANDIDATES
+    doctors sharing the most trigrams with the query are scored.
+
+    The index is loaded on first use, kept current by the writes of the handlers sharing
+    it, and reloaded after `ttl_s` for other writers.
+    """
+
+    def __init__(self, ttl_s=300.0):
+        self.ttl_s = ttl_s
+        self._doctors = {}   # doctor_id -> (name, specialization, name trigrams, word trigrams)
+        self._postings = {}  # trigram -> doctor ids
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self, handler):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl_s:
+                return
+        rows = handler.connection.execute("SELECT doctor_id, name, specialization FROM doctors").fetchall()
+        with self._lock:
+            self._doctors, self._postings = {}, {}
+            for row in rows:
+                self._add(*row)
+            self._loaded_at = time.monotonic()
+
+    def _add(self, doctor_id, name, specialization):
+        normalized = _normalize_name(name)
+        grams = _trigrams(normalized)
+        words = [_trigrams(word) for word in normalized.split()]
+        self._doctors[doctor_id] = (name, specialization, grams, words)
+        for gram in grams.union(*words):
+            self._postings.setdefault(gram, set()).add(doctor_id)
+
+    def add(self, doctor_id, name, specialization):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._add(doctor_id, name, specialization)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def search(self, handler, name: str, specialization: str = None, limit: int = 5) -> list:
+        self._ensure_loaded(handler)
+        normalized = _normalize_name(name)
+        if not normalized:
+            return []
+        grams = _trigrams(normalized)
+        words = [_trigrams(word) for word in normalized.split()]
+        wanted = specialization.lower() if specialization else None
+
+        candidates = []
+        with self._lock:
+            # only the doctors sharing the most trigrams with the query can score well
+            shared = Counter()
+            for gram in grams.union(*words):
+                shared.update(self._postings.get(gram, ()))
+            scored = 0
+            for doctor_id, _ in shared.most_common():
+                doctor_name, doctor_specialization, doctor_grams, doctor_words = self._doctors[doctor_id]
+                if wanted and doctor_specialization.lower() != wanted:
+                    continue
+                if scored == NAME_SEARCH_CANDIDATES:
+                    break
+                scored += 1
+                by_word = sum(max((_dice(word, other) for other in doctor_words), default=0.0) for word in words) / len(words)
+                score = max(_dice(grams, doctor_grams), by_word)
+                if score >= MIN_CANDIDATE_SCORE:
+                    candidates.append(DoctorCandidate(doctor_id, doctor_name, doctor_specialization, round(score, 3)))
+
+        candidates.sort(key=lambda candidate: (-candidate.score, candidate.name))
+        return candidates[:limit]
+
+    def resolve(self, handler, name: str, specialization: str = None):
+        """
+        The best candidate when it is a clear match: scored at least AUTO_RESOLVE_SCORE and
+        AUTO_RESOLVE_MARGIN ahead of the runner-up. None otherwise.
+        """
+        candidates = self.search(handler, name, specialization, limit=2)
+        if not candidates or candidates[0].score < AUTO_RESOLVE_SCORE:
+            return None
+        if len(candidates) > 1 and candidates[0].score - candidates[1].score < AUTO_RESOLVE_MARGIN:
+            return None
+        return candidates[0]
+
+
+class AppointmentDBPool:
+    """
+    A fixed set of long-lived `AppointmentDBHandler`s shared by the tool worker threads.
+
+    The schema is created once, by the first handler, so a checkout costs a queue get
+    instead of a connect, three `CREATE TABLE IF NOT EXISTS` and a commit. Handlers idle
+    for longer than `health_check_s` are pinged on checkout and replaced when the ping
+    fails. Every in-memory connection is its own database, so ":memory:" pools hold one handler.
+    All handlers share one `DoctorNameIndex`, and one `SlotIndex` when given one or else
+    one `SlotCache`.
+    """
+
+    def __init__(self, db_name="hospital.db", size=4, health_check_s=30.0, slot_cache=None, slot_index=None):
+        self.db_name = db_name
+        if slot_index is not None:
+            self.slot_cache = None
+        else:
+            self.slot_cache = slot_cache if slot_cache is not None else SlotCache()
+        self.slot_index = slot_index
+        self.name_index = DoctorNameIndex()
+        self.size = 1 if db_name == ":memory:" else size
+        self.health_check_s = health_check_s
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.checkouts = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.health_checks = 0
+        self.replaced = 0
+
+        for index in range(self.size):
+            self._idle.put((self._connect(create_tables=index == 0), time.monotonic()))
+
+    def _connect(self, create_tables=False):
+        return AppointmentDBHandler(
+            self.db_name,
+            create_tables=create_tables,
+            check_same_thread=False,
+            slot_cache=self.slot_cache,
+            slot_index=self.slot_index,
+            name_index=self.name_index,
+        )
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Borrow a handler for the duration of the `with` block.
+
+        Raises `queue.Empty` when no handler is returned within `timeout` seconds.
+        """
+        if self._closed:
+            raise RuntimeError("AppointmentDBPool is closed")
+
+        started = time.perf_counter()
+        handler, idle_since = self._idle.get(timeout=timeout)
+        waited = time.perf_counter() - started
+
+        if time.monotonic() - idle_since > self.health_check_s:
+            handler = self._check(handler)
+
+        with self._lock:
+            self.checkouts += 1
+            self.wait_s += waited
+            self.max_wait_s = max(self.max_wait_s, waited)
+
+        try:
+            yield handler
+        finally:
+            try:
+                if handler.connection.in_transaction:
+                    # don't hand the next caller a half-finished write
+                    handler.connection.rollback()
+            except sqlite3.Error:
+                pass  # a dead connection, the next health check replaces it
+            if self._closed:
+                handler.close()
+            else:
+                self._idle.put((handler, time.monotonic()))
+
+    def _check(self, handler):
+        with self._lock:
+            self.health_checks += 1
+        if handler.ping():
+            return handler
+
+        try:
+            handler.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self.replaced += 1
+        return self._connect()
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self.checkouts or 1
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "mean_wait_ms": self.wait_s / checkouts * 1000,
+                "max_wait_ms": self.max_wait_s * 1000,
+                "health_checks": self.health_checks,
+                "replaced": self.replaced,
+                "slot_cache": self.slot_cache.stats() if self.slot_cache is not None else None,
+                "slot_index": self.slot_index.stats() if self.slot_index is not None else None,
+            }
+
+    def close(self):
+        """
+        Close the idle handlers, handlers still checked out are closed when they are returned.
+        """
+        self._closed = True
+        while True:
+            try:
+                handler, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            handler.close()
+
+
+DATE_CACHE_SIZE = 4096
+
+_D = r"\d{1,2}"
+_Y = r"\d{4}"
+_P = r"[AaPp][Mm]"
+
+# (shape, format) of every supported absolute date, the shapes are mutually exclusive so
+# a match names the one format that can parse the input
+_DATE_SHAPES = [
+    (rf"{_Y}-{_D}-{_D}\s+{_D}:{_D}:{_D}", "%Y-%m-%d %H:%M:%S"),           # Example: 2025-10-10 16:00:00
+    (rf"{_Y}-{_D}-{_D}\s+{_D}:{_D}:{_D}\s+{_P}", "%Y-%m-%d %I:%M:%S %p"),  # Example: 2025-10-10 4:00:00 PM
+    (rf"{_Y}-{_D}-{_D}\s+{_D}:{_D}\s+{_P}", "%Y-%m-%d %I:%M %p"),          # Example: 2025-10-10 4:00 PM
+    (rf"{_D}/{_D}/{_Y}\s+{_D}:{_D}:{_D}", "%d/%m/%Y %H:%M:%S"),           # Example: 10/10/2025 16:00:00
+    (rf"{_D}-{_D}-{_Y}\s+{_D}:{_D}:{_D}", "%d-%m-%Y %H:%M:%S"),           # Example: 10-10-2025 16:00:00
+    (rf"{_D}/{_D}/{_Y}\s+{_D}:{_D}:{_D}\s+{_P}", "%d/%m/%Y %I:%M:%S %p"),  # Example: 10/10/2025 4:00:00 PM
+    (rf"{_D}-{_D}-{_Y}\s+{_D}:{_D}:{_D}\s+{_P}", "%d-%m-%Y %I:%M:%S %p"),  # Example: 10-10-2025 4:00:00 PM
+    (rf"{_D}/{_D}/{_Y}\s+{_D}:{_D}\s+{_P}", "%d/%m/%Y %I:%M %p"),          # Example: 10/10/2025 4:00 PM
+    (rf"{_D}-{_D}-{_Y}\s+{_D}:{_D}\s+{_P}", "%d-%m-%Y %I:%M %p"),          # Example: 10-10-2025 4:00 PM
+    (rf"[A-Za-z]+\s+{_D},\s+{_Y}\s+{_D}:{_D}\s+{_P}", "%B %d, %Y %I:%M %p"),  # Example: October 10, 2025 4:00 PM
+    (rf"{_D}\s+[A-Za-z]+\s+{_Y}\s+{_D}:{_D}\s+{_P}", "%d %B %Y %I:%M %p"),   # Example: 10 October 2025 4:00 PM
+    (rf"{_Y}-{_D}-{_D}T{_D}:{_D}", "%Y-%m-%dT%H:%M"),                       # Example: 2025-10-10T16:00
+    (rf"{_Y}-{_D}-{_D}T{_D}:{_D}{_P}", "%Y-%m-%dT%I:%M%p"),                 # Example: 2025-10-10T4:00PM
+]
+_DATE_FORMATS = [fmt for _, fmt in _DATE_SHAPES]
+_ABSOLUTE_DATE = re.compile("|".join(f"(?P<f{i}>{shape})" for i, (shape, _) in enumerate(_DATE_SHAPES)))
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_RELATIVE_DATE = re.compile(
+    rf"""
+    (?:
+        (?P<day>today|tomorrow|(?:the\s+)?day\s+after\s+tomorrow)
+      | (?:(?P<which>this|next)\s+)?(?P<weekday>{"|".join(_WEEKDAYS)})
+      | in\s+(?P<days>\d+)\s+days?
+    )
+    (?:\s*,?\s*at)?\s+
+    (?:
+        (?P<hour>\d{{1,2}})(?::(?P<minute>\d{{2}}))?\s*(?P<ampm>[ap]\.?m\.?)?
+      | (?P<noon>noon)
+    )
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
 def convert_to_standard_format(input_date: str) -> str:
+    """
+    Normalize a date and time to 'YYYY-MM-DD HH:MM:SS', None when it isn't understood.
+
+    Accepts the absolute formats listed in `_DATE_SHAPES` and relative phrases such as
+    "tomorrow at 5pm", "next Monday 10am" or "in 3 days at 14:30". Results are cached,
+    keyed on today's date so relative phrases roll over at midnight.
+    """
+    if not isinstance(input_date, str):
+        return None
+    return _parse_date(input_date.strip(), datetime.now().date())
 
-    supported_formats = [
-        "%Y-%m-%d %H:%M:%S",       # Example: 2025-10-10 16:00:00
-        "%Y-%m-%d %I:%M:%S %p",    # Example: 2025-10-10 4:00:00 PM
-        "%Y-%m-%d %I:%M %p",       # Example: 2025-10-10 4:00 PM
-        "%d/%m/%Y %H:%M:%S",       # Example: 10/10/2025 16:00:00
-        "%d-%m-%Y %H:%M:%S",       # Example: 10-10-2025 16:00:00
-        "%d/%m/%Y %I:%M:%S %p",    # Example: 10/10/2025 4:00:00 PM
-        "%d-%m-%Y %I:%M:%S %p",    # Example: 10-10-2025 4:00:00 PM
-        "%d/%m/%Y %I:%M %p",       # Example: 10/10/2025 4:00 PM
-        "%d-%m-%Y %I:%M %p",       # Example: 10-10-2025 4:00 PM
-        "%B %d, %Y %I:%M %p",      # Example: October 10, 2025 4:00 PM
-        "%d %B %Y %I:%M %p",       # Example: 10 October 2025 4:00 PM
-        "%Y-%m-%dT%H:%M",          # Example: 2025-10-10T16:00
-        "%Y-%m-%dT%I:%M%p",        # Example: 2025-10-10T4:00PM
-    ]
-
-    for fmt in supported_formats:
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date(text: str, today) -> str:
+    match = _ABSOLUTE_DATE.fullmatch(text)
+    if match:
         try:
-            date_obj = datetime.strptime(input_date, fmt)
-            
-            return date_obj.strftime("%Y-%m-%d %H:%M:%S")
+            date_obj = datetime.strptime(text, _DATE_FORMATS[int(match.lastgroup[1:])])
         except ValueError:
-            # If the current format fails, continue with the next format
-            continue
+            return None
+        return date_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+    match = _RELATIVE_DATE.fullmatch(text)
+    if match:
+        return _resolve_relative(match, today)
     return None
 
+def _resolve_relative(match, today) -> str:
+    if match["day"]:
+        word = match["day"].lower()
+        offset = 0 if word == "today" else 1 if word == "tomorrow" else 2
+    elif match["weekday"]:
+        # "Monday" and "this Monday" may be today, "next Monday" is always ahead
+        offset = (_WEEKDAYS.index(match["weekday"].lower()) - today.weekday()) % 7
+        if match["which"] and match["which"].lower() == "next" and offset == 0:
+            offset = 7
+    else:
+        offset = int(match["days"])
+
+    if match["noon"]:
+        hour, minute = 12, 0
+    else:
+        hour, minute = int(match["hour"]), int(match["minute"] or 0)
+        if match["ampm"]:
+            # a bare hour without am/pm is taken as a 24-hour time
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if match["ampm"][0].lower() == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+
+    try:
+        day = datetime.combine(today, datetime.min.time()) + timedelta(days=offset)
+    except OverflowError:
+        # "in 99999999 days" is past year 9999
+        return None
+    return day.replace(hour=hour, minute=minute).strftime("%Y-%m-%d %H:%M:%S")
+
+def _new_id() -> str:
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
 def clean_doctor_name(doctor_name: str) -> str:
     return re.sub(r"^dr\.\s*", "", doctor_name, flags=re.IGNORECASE)
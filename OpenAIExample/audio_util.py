@@ -1,15 +1,26 @@
 from __future__ import annotations
 
 import io
+import os
+import time
+import wave
 import base64
 import asyncio
-import threading
-from typing import Callable, Awaitable
+import binascii
+import hashlib
+import inspect
+import tempfile
+import subprocess
+from math import gcd
+from functools import lru_cache
+from typing import Callable, Iterator, Awaitable
+from collections import deque
 
 import numpy as np
 import pyaudio
 import sounddevice as sd
 from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
 
 from openai.resources.beta.realtime.realtime import AsyncRealtimeConnection
 
@@ -17,11 +28,97 @@ CHUNK_LENGTH_S = 0.05  # 100ms
 SAMPLE_RATE = 24000
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
+PLAYBACK_BUFFER_S = 120  # preallocated playback ring, responses arrive faster than realtime
+JITTER_PREROLL_MS = 60
+JITTER_MAX_DELAY_MS = 400
+TALKSPURT_GAP_S = 1.0  # arrival gaps longer than this start a new response, not jitter
+MIC_FRAME_S = 0.02
+MIC_QUEUE_FRAMES = 50  # 1s of mic frames before the oldest ones are dropped
+PACKET_MS = 100  # duration of audio carried by each input_audio_buffer.append message
+FILE_CHUNK_MS = 100
+RESAMPLER_TAPS = 32  # filter taps per polyphase branch
+RESAMPLER_BLOCK = 8192  # output samples computed per vectorised step
+AUDIO_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "realtime-api", "audio")
+AUDIO_CACHE_MAX_BYTES = 512 * 1024 * 1024
+VAD_SAMPLE_RATE = 8000  # webrtcvad does not accept 24kHz, frames are decimated by 3 for classification
 
 # pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
 
 
-def audio_to_pcm16_base64(audio_bytes: bytes) -> bytes:
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Average interleaved int16 or float32 samples down to mono float32."""
+    if channels == 1:
+        return samples.reshape(-1).astype(np.float32, copy=False)
+    return samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+
+
+class Resampler:
+    """Streaming polyphase resampler and downmixer to 24kHz mono pcm16.
+
+    The rate ratio is reduced to `up / down` and a Kaiser-windowed sinc low-pass is split
+    into `up` branches of `taps_per_phase` taps, so each output sample costs one short dot
+    product, computed for a whole chunk at once. Chunks may have any length (whole frames
+    only); the filter history is carried over so chunked output matches one-shot output.
+    """
+
+    def __init__(self, from_rate: int, channels: int = 1, to_rate: int = SAMPLE_RATE, taps_per_phase: int = RESAMPLER_TAPS):
+        divisor = gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        self.channels = channels
+        self._taps = taps_per_phase
+
+        # low-pass at the lower of the two Nyquist rates, designed at the upsampled rate
+        length = self.up * taps_per_phase
+        cutoff = 0.5 / max(self.up, self.down) * 0.95
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0)
+        prototype *= self.up / prototype.sum()
+        # phases[p] holds h[p], h[p + up], ... reversed, to line up with input windows oldest first
+        self._phases = np.ascontiguousarray(prototype.reshape(taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+        self._history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self._consumed = 0  # input frames seen so far
+        self._produced = 0  # output samples emitted so far
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample a chunk of interleaved int16 or float32 samples, returns int16."""
+        mono = downmix(samples, self.channels)
+        if not len(mono):
+            return np.zeros(0, dtype=np.int16)
+        if self.up == self.down:
+            return np.clip(np.rint(mono), -32768, 32767).astype(np.int16)
+
+        extended = np.concatenate((self._history, mono))
+        total = self._consumed + len(mono)
+
+        # output n needs input frame floor(n * down / up), which must already have arrived
+        n = np.arange(self._produced, (total * self.up + self.down - 1) // self.down, dtype=np.int64)
+        position = n * self.down
+        first = position // self.up - self._consumed
+        phase = position % self.up
+        windows = np.lib.stride_tricks.sliding_window_view(extended, self._taps)
+
+        # gather in blocks so one-shot conversions of long files don't materialise every window
+        out = np.empty(len(n), dtype=np.float32)
+        for start in range(0, len(n), RESAMPLER_BLOCK):
+            block = slice(start, start + RESAMPLER_BLOCK)
+            out[block] = np.einsum("ij,ij->i", windows[first[block]], self._phases[phase[block]])
+
+        self._history = extended[len(extended) - (self._taps - 1) :]
+        self._consumed = total
+        self._produced += len(n)
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def convert_pcm16(data: bytes, sample_rate: int, channels: int) -> bytes:
+    """Convert raw pcm16 at any rate and channel count to 24kHz mono pcm16 in-process."""
+    if (sample_rate, channels) == (SAMPLE_RATE, CHANNELS):
+        return data
+    return Resampler(sample_rate, channels).process(np.frombuffer(data, dtype=np.int16)).tobytes()
+
+
+def _pydub_to_pcm16(audio_bytes: bytes) -> bytes:
     # load the audio file from the byte stream
     audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
     print(f"Loaded audio: {audio.frame_rate=} {audio.channels=} {audio.sample_width=} {audio.frame_width=}")
@@ -30,10 +127,404 @@ def audio_to_pcm16_base64(audio_bytes: bytes) -> bytes:
     return pcm_audio
 
 
+def audio_to_pcm16_base64(audio_bytes: bytes) -> bytes:
+    # pcm16 WAV is converted in-process, compressed containers still go through pydub/ffmpeg
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            if wav.getsampwidth() == 2:
+                return convert_pcm16(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels())
+    except (wave.Error, EOFError):
+        pass
+    return _pydub_to_pcm16(audio_bytes)
+
+
+def iter_pcm16_file(path: str, chunk_ms: float = FILE_CHUNK_MS) -> Iterator[bytes]:
+    """Decode an audio file to 24kHz mono pcm16 incrementally, `chunk_ms` at a time.
+
+    Only one chunk is held in memory at once, whatever the length of the recording. pcm16
+    WAV files are read and resampled in-process, anything else is decoded by a streaming
+    ffmpeg process (the same binary pydub uses). Raises `CouldntDecodeError` with
+    ffmpeg's error output when it fails, after yielding whatever it did decode.
+    """
+    chunk_bytes = int(SAMPLE_RATE * chunk_ms / 1000) * CHANNELS * 2
+
+    try:
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() == 2:
+                rate, channels = wav.getframerate(), wav.getnchannels()
+                resampler = None if (rate, channels) == (SAMPLE_RATE, CHANNELS) else Resampler(rate, channels)
+                frames_per_chunk = int(rate * chunk_ms / 1000)
+                while chunk := wav.readframes(frames_per_chunk):
+                    if resampler is not None:
+                        chunk = resampler.process(np.frombuffer(chunk, dtype=np.int16)).tobytes()
+                    yield chunk
+                return
+    except (wave.Error, EOFError):
+        pass
+
+    # stderr goes to a file rather than a pipe, so ffmpeg never blocks on errors nobody reads yet
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(
+            [
+                AudioSegment.converter, "-nostdin", "-loglevel", "error",
+                "-i", path,
+                "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE),
+                "-",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=errors,
+        )
+        assert process.stdout is not None
+        try:
+            while chunk := process.stdout.read(chunk_bytes):
+                yield chunk
+            if process.wait() != 0:
+                errors.seek(0)
+                message = errors.read().decode(errors="replace").strip()
+                raise CouldntDecodeError(f"ffmpeg could not decode {path} (exit code {process.returncode}): {message}")
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+
+class AudioCache:
+    """On-disk cache of decoded 24kHz mono pcm16, keyed by content hash and target format.
+
+    Entries are served back as read-only memory maps, so repeated scenario runs skip the
+    decode entirely. The file mtime doubles as the last access time and the least recently
+    used entries are evicted once the cache grows past `max_bytes`.
+    """
+
+    FORMAT_KEY = f"pcm16-{SAMPLE_RATE}-{CHANNELS}"
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # content hashes of source files we have already read, by (path, size, mtime)
+        self._keys: dict[tuple[str, int, float], str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, path: str) -> str:
+        stat = os.stat(path)
+        source = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        if source not in self._keys:
+            digest = hashlib.sha256(self.FORMAT_KEY.encode())
+            with open(path, "rb") as f:
+                while block := f.read(1024 * 1024):
+                    digest.update(block)
+            self._keys[source] = digest.hexdigest()
+        return self._keys[source]
+
+    def load(self, path: str) -> np.ndarray:
+        """Return the decoded samples of `path` as a read-only int16 memory map.
+
+        Raises `CouldntDecodeError` when the file can't be decoded or holds no audio,
+        nothing is cached then.
+        """
+        entry = os.path.join(self.directory, f"{self.key(path)}.pcm")
+
+        # entries are never empty, an empty one is left over from a failed decode
+        if os.path.exists(entry) and os.path.getsize(entry) > 0:
+            self.hits += 1
+            os.utime(entry)
+        else:
+            self.misses += 1
+            partial = f"{entry}.{os.getpid()}.tmp"
+            try:
+                with open(partial, "wb") as f:
+                    for chunk in iter_pcm16_file(path):
+                        f.write(chunk)
+                    decoded = f.tell()
+                if not decoded:
+                    raise CouldntDecodeError(f"{path} decoded to no audio")
+                # publish atomically so concurrent runs never map a half-written entry
+                os.replace(partial, entry)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            self._evict(keep=entry)
+
+        return np.memmap(entry, dtype=np.int16, mode="r")
+
+    def iter_chunks(self, path: str, chunk_ms: float = FILE_CHUNK_MS) -> Iterator[memoryview]:
+        samples = self.load(path)
+        chunk_samples = int(SAMPLE_RATE * chunk_ms / 1000) * CHANNELS
+        for start in range(0, len(samples), chunk_samples):
+            yield memoryview(samples[start : start + chunk_samples]).cast("B")
+
+    def _evict(self, keep: str) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pcm"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            try:
+                os.remove(entry)
+            except OSError:
+                # still mapped by another process on platforms that forbid that, try next time
+                continue
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+async def send_audio_file(
+    connection: AsyncRealtimeConnection,
+    path: str,
+    chunk_ms: float = FILE_CHUNK_MS,
+    realtime: bool = True,
+    cache: AudioCache | None = None,
+) -> float:
+    """Stream an audio file into the input audio buffer and return the seconds sent.
+
+    With `realtime` the chunks are paced against the clock like a live caller, otherwise
+    they are sent as fast as the websocket accepts them. With a `cache` the decoded audio
+    is read back from it instead of being decoded again.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = cache.iter_chunks(path, chunk_ms) if cache is not None else iter_pcm16_file(path, chunk_ms)
+    started = loop.time()
+    sent_s = 0.0
+
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            if realtime:
+                # schedule against the start time so pacing does not drift over long files
+                await asyncio.sleep(max(0.0, started + sent_s - loop.time()))
+
+            await connection.input_audio_buffer.append(audio=base64.b64encode(chunk).decode("utf-8"))
+            sent_s += len(chunk) / (SAMPLE_RATE * CHANNELS * 2)
+    finally:
+        chunks.close()
+
+    return sent_s
+
+
+class RingBuffer:
+    """Preallocated single-producer/single-consumer ring of int16 samples.
+
+    The producer (the event loop) only ever advances `_write_pos` and the consumer
+    (the PortAudio callback) only ever advances `_read_pos`. Both positions grow
+    monotonically and are published after the samples are copied, so neither side
+    needs a lock and the consumer never allocates.
+    """
+
+    def __init__(self, capacity: int):
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._capacity = capacity
+        self._write_pos = 0
+        self._read_pos = 0
+        self._starved = True
+        self._flush_requested = 0
+        self._flush_done = 0
+
+        # underruns: times playback ran dry after having data, overruns: writes that did not fit
+        self.underruns = 0
+        self.underrun_frames = 0
+        self.overruns = 0
+        self.overrun_frames = 0
+        self.flushed_frames = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def available(self) -> int:
+        return self._write_pos - self._read_pos
+
+    def write(self, data: np.ndarray) -> int:
+        """Copy `data` into the ring, dropping whatever does not fit. Producer side only."""
+        n = len(data)
+        free = self._capacity - (self._write_pos - self._read_pos)
+        if n > free:
+            self.overruns += 1
+            self.overrun_frames += n - free
+            n = free
+        if n == 0:
+            return 0
+
+        start = self._write_pos % self._capacity
+        first = min(n, self._capacity - start)
+        self._buffer[start : start + first] = data[:first]
+        if first < n:
+            self._buffer[: n - first] = data[first:n]
+
+        self._write_pos += n
+        return n
+
+    def request_flush(self) -> None:
+        """Ask the consumer to drop everything queued so far on its next block. Producer side."""
+        self._flush_requested += 1
+
+    def flush_pending(self) -> bool:
+        return self._flush_requested != self._flush_done
+
+    def _apply_flush(self) -> bool:
+        requested = self._flush_requested
+        if requested == self._flush_done:
+            return False
+        write_pos = self._write_pos
+        self.flushed_frames += write_pos - self._read_pos
+        self._read_pos = write_pos
+        self._flush_done = requested
+        return True
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Fill `out` from the ring and zero the remainder. Consumer side only."""
+        self._apply_flush()
+        frames = len(out)
+        n = min(frames, self._write_pos - self._read_pos)
+
+        if n > 0:
+            start = self._read_pos % self._capacity
+            first = min(n, self._capacity - start)
+            out[:first] = self._buffer[start : start + first]
+            if first < n:
+                out[first:n] = self._buffer[: n - first]
+            self._read_pos += n
+
+        if n < frames:
+            out[n:] = 0
+            if not self._starved:
+                self.underruns += 1
+                self.underrun_frames += frames - n
+            self._starved = True
+        else:
+            self._starved = False
+
+        return n
+
+    def clear(self) -> None:
+        """Drop all buffered samples. Only safe while the consumer is not running."""
+        self._read_pos = self._write_pos
+        self._starved = True
+
+
+class JitterBuffer(RingBuffer):
+    """Ring buffer with adaptive playout delay for bursty response audio.
+
+    Playback is held back until `target` frames are queued. The target starts at the
+    pre-roll and follows the smoothed lateness of `write` calls (the RFC 3550 estimator,
+    counting late arrivals only), capped at `max_delay_ms`. When the buffer runs dry it goes back to
+    buffering instead of trickling out partial blocks, and the short tail of a response
+    is released once arrivals stop.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        preroll_ms: float = JITTER_PREROLL_MS,
+        max_delay_ms: float = JITTER_MAX_DELAY_MS,
+        jitter_factor: float = 3.0,
+        histogram_bin_ms: int = 20,
+        histogram_bins: int = 25,
+    ):
+        super().__init__(capacity)
+        self._min_target = int(preroll_ms * SAMPLE_RATE / 1000)
+        self._max_target = max(self._min_target, int(max_delay_ms * SAMPLE_RATE / 1000))
+        self._jitter_factor = jitter_factor
+        self._buffering = True
+        self._last_arrival: float | None = None
+        self._last_duration = 0.0
+        self._drained_at: float | None = None
+
+        self.target = self._min_target
+        self.jitter = 0.0  # seconds
+        self.underrun_events = 0
+
+        # buffer depth seen by the callback while audio is flowing, in `histogram_bin_ms` bins
+        self.histogram_bin_ms = histogram_bin_ms
+        self.histogram = np.zeros(histogram_bins, dtype=np.int64)
+        self._bin_frames = int(histogram_bin_ms * SAMPLE_RATE / 1000)
+
+    def write(self, data: np.ndarray) -> int:
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            interval = now - self._last_arrival
+            if interval < TALKSPURT_GAP_S:
+                # responses stream faster than real time, an early chunk only queues up,
+                # only chunks arriving after the previous one has played out can starve playback
+                deviation = max(0.0, interval - self._last_duration)
+                self.jitter += (deviation - self.jitter) / 16
+                target = int(self._jitter_factor * self.jitter * SAMPLE_RATE)
+                self.target = min(max(target, self._min_target), self._max_target)
+
+                if self._drained_at is not None and now - self._drained_at < TALKSPURT_GAP_S:
+                    # ran dry while the response was still arriving
+                    self.underrun_events += 1
+        self._drained_at = None
+
+        self._last_arrival = now
+        self._last_duration = len(data) / SAMPLE_RATE
+        return super().write(data)
+
+    def read_into(self, out: np.ndarray) -> int:
+        if self._apply_flush():
+            self._buffering = True
+        available = self.available()
+        if available > 0 or not self._buffering:
+            self.histogram[min(available // self._bin_frames, len(self.histogram) - 1)] += 1
+
+        if self._buffering:
+            last_arrival = self._last_arrival
+            arrivals_stopped = (
+                last_arrival is not None and time.monotonic() - last_arrival > self.target / SAMPLE_RATE
+            )
+            if available >= self.target or (available > 0 and arrivals_stopped):
+                self._buffering = False
+            else:
+                out[:] = 0
+                return 0
+
+        n = super().read_into(out)
+        if n < len(out):
+            self._buffering = True
+            self._drained_at = time.monotonic()
+        return n
+
+    def clear(self) -> None:
+        super().clear()
+        self._buffering = True
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "target_ms": self.target * 1000 / SAMPLE_RATE,
+            "jitter_ms": self.jitter * 1000,
+            "underrun_events": self.underrun_events,
+            "depth_histogram_ms": {
+                (i + 1) * self.histogram_bin_ms: int(count) for i, count in enumerate(self.histogram)
+            },
+        }
+
+
 class AudioPlayerAsync:
-    def __init__(self):
-        self.queue = []
-        self.lock = threading.Lock()
+    def __init__(
+        self,
+        buffer_length_s: float = PLAYBACK_BUFFER_S,
+        jitter_buffer: bool = False,
+        preroll_ms: float = JITTER_PREROLL_MS,
+        max_delay_ms: float = JITTER_MAX_DELAY_MS,
+    ):
+        capacity = int(buffer_length_s * SAMPLE_RATE)
+        if jitter_buffer:
+            self.buffer: RingBuffer = JitterBuffer(capacity, preroll_ms=preroll_ms, max_delay_ms=max_delay_ms)
+        else:
+            self.buffer = RingBuffer(capacity)
         self.stream = sd.OutputStream(
             callback=self.callback,
             samplerate=SAMPLE_RATE,
@@ -45,24 +536,8 @@ class AudioPlayerAsync:
         self._frame_count = 0
 
     def callback(self, outdata, frames, time, status):  # noqa
-        with self.lock:
-            data = np.empty(0, dtype=np.int16)
-
-            # get next item from queue if there is still space in the buffer
-            while len(data) < frames and len(self.queue) > 0:
-                item = self.queue.pop(0)
-                frames_needed = frames - len(data)
-                data = np.concatenate((data, item[:frames_needed]))
-                if len(item) > frames_needed:
-                    self.queue.insert(0, item[frames_needed:])
-
-            self._frame_count += len(data)
-
-            # fill the rest of the frames with zeros if there is no more data
-            if len(data) < frames:
-                data = np.concatenate((data, np.zeros(frames - len(data), dtype=np.int16)))
-
-        outdata[:] = data.reshape(-1, 1)
+        # copy straight into the device buffer, no locks and no allocations on the audio thread
+        self._frame_count += self.buffer.read_into(outdata[:, 0])
 
     def reset_frame_count(self):
         self._frame_count = 0
@@ -71,72 +546,435 @@ class AudioPlayerAsync:
         return self._frame_count
 
     def add_data(self, data: bytes):
-        with self.lock:
-            # bytes is pcm16 single channel audio data, convert to numpy array
-            np_data = np.frombuffer(data, dtype=np.int16)
-            self.queue.append(np_data)
-            if not self.playing:
-                self.start()
+        # bytes is pcm16 single channel audio data, view it as a numpy array without copying
+        np_data = np.frombuffer(data, dtype=np.int16)
+        self.buffer.write(np_data)
+        if not self.playing:
+            self.start()
+
+    def add_base64(self, delta: str):
+        # a2b_base64 takes the str as is, b64decode would first copy it into bytes
+        self.add_data(binascii.a2b_base64(delta))
 
     def start(self):
         self.playing = True
         self.stream.start()
 
+    async def interrupt(self) -> int:
+        """Drop all queued audio within one block and return the frames played since the last reset."""
+        if not self.playing:
+            self.buffer.clear()
+            return self._frame_count
+
+        self.buffer.request_flush()
+        deadline = time.monotonic() + 2 * CHUNK_LENGTH_S
+        while self.buffer.flush_pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        return self._frame_count
+
     def stop(self):
         self.playing = False
         self.stream.stop()
-        with self.lock:
-            self.queue = []
+        self.buffer.clear()
+
+    def stats(self) -> dict[str, object]:
+        stats: dict[str, object] = {
+            "buffered_frames": self.buffer.available(),
+            "underruns": self.buffer.underruns,
+            "underrun_frames": self.buffer.underrun_frames,
+            "overruns": self.buffer.overruns,
+            "overrun_frames": self.buffer.overrun_frames,
+            "flushed_frames": self.buffer.flushed_frames,
+        }
+        if isinstance(self.buffer, JitterBuffer):
+            stats.update(self.buffer.stats())
+        return stats
 
     def terminate(self):
         self.stream.close()
 
 
+class FramePool:
+    """Reusable int16 frame buffers.
+
+    `acquire` hands out a free buffer and only allocates when the pool is empty, so an
+    `allocations` count that stays flat after warm-up shows the path runs allocation-free.
+    Buffers may be acquired on the audio thread and released on the event loop.
+    """
+
+    def __init__(self, frame_size: int, size: int):
+        self.frame_size = frame_size
+        self._free = [np.empty(frame_size, dtype=np.int16) for _ in range(size)]
+        self.acquired = 0
+        self.allocations = 0
+
+    def acquire(self) -> np.ndarray:
+        self.acquired += 1
+        try:
+            return self._free.pop()
+        except IndexError:
+            self.allocations += 1
+            return np.empty(self.frame_size, dtype=np.int16)
+
+    def release(self, frame: np.ndarray) -> None:
+        if len(frame) == self.frame_size:
+            self._free.append(frame)
+
+
+_B64_ALPHABET = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/", dtype=np.uint8)
+
+
+class AppendEncoder:
+    """Builds `input_audio_buffer.append` messages in a single preallocated buffer.
+
+    The audio is base64-encoded with NumPy directly into the JSON envelope, so the only
+    per-message copy is the base64 text handed to the SDK, or none at all when the envelope
+    is sent as is (see `send_append`). The returned view is only valid until the next `encode`.
+    """
+
+    PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+    SUFFIX = b'"}'
+
+    def __init__(self, max_audio_bytes: int):
+        self.resizes = 0
+        self._allocate(max_audio_bytes)
+
+    def _allocate(self, max_audio_bytes: int) -> None:
+        groups = -(-max_audio_bytes // 3)
+        self._envelope = np.empty(len(self.PREFIX) + 4 * groups + len(self.SUFFIX), dtype=np.uint8)
+        self._envelope[: len(self.PREFIX)] = np.frombuffer(self.PREFIX, dtype=np.uint8)
+        # intp scratch: uint8 indices would make np.take allocate a converted copy on every call
+        self._groups = np.empty((groups, 3), dtype=np.intp)
+        self._indices = np.empty((groups, 4), dtype=np.intp)
+        self._scratch = np.empty(groups, dtype=np.intp)
+
+    def encode(self, audio: np.ndarray) -> memoryview:
+        """Encode uint8 `audio` into the envelope and return a view of the whole message."""
+        if -(-len(audio) // 3) > len(self._indices):
+            self.resizes += 1
+            self._allocate(len(audio))
+
+        full = len(audio) // 3
+        groups = self._groups[:full]
+        np.copyto(groups, audio[: 3 * full].reshape(full, 3))
+        indices = self._indices[:full]
+        scratch = self._scratch[:full]
+
+        # split every 3 bytes into four 6-bit alphabet indices, in place
+        np.right_shift(groups[:, 0], 2, out=indices[:, 0])
+        np.bitwise_and(groups[:, 0], 0x03, out=indices[:, 1])
+        np.left_shift(indices[:, 1], 4, out=indices[:, 1])
+        np.right_shift(groups[:, 1], 4, out=scratch)
+        np.bitwise_or(indices[:, 1], scratch, out=indices[:, 1])
+        np.bitwise_and(groups[:, 1], 0x0F, out=indices[:, 2])
+        np.left_shift(indices[:, 2], 2, out=indices[:, 2])
+        np.right_shift(groups[:, 2], 6, out=scratch)
+        np.bitwise_or(indices[:, 2], scratch, out=indices[:, 2])
+        np.bitwise_and(groups[:, 2], 0x3F, out=indices[:, 3])
+
+        start = len(self.PREFIX)
+        end = start + 4 * full
+        # mode="clip" writes straight into `out`, the default mode buffers it first
+        np.take(_B64_ALPHABET, indices.reshape(-1), out=self._envelope[start:end], mode="clip")
+
+        if len(audio) > 3 * full:
+            # at most 2 trailing bytes, padded the usual way
+            self._envelope[end : end + 4] = np.frombuffer(base64.b64encode(audio[3 * full :].tobytes()), dtype=np.uint8)
+            end += 4
+
+        self._envelope[end : end + len(self.SUFFIX)] = np.frombuffer(self.SUFFIX, dtype=np.uint8)
+        return memoryview(self._envelope[: end + len(self.SUFFIX)])
+
+
+@lru_cache(maxsize=None)
+def _sends_bytes_as_text(websocket_type: type) -> bool:
+    try:
+        return "text" in inspect.signature(websocket_type.send).parameters
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+async def send_append(connection: AsyncRealtimeConnection, message: memoryview, raw_websocket: bool = False) -> None:
+    """Send an `input_audio_buffer.append` message built by an `AppendEncoder`.
+
+    By default the base64 audio is cut out of the message and sent with `connection.send`.
+    `raw_websocket` is an opt-in that relies on SDK internals: the message is written as a
+    text frame to the SDK's private websocket, `connection._connection` (websockets >= 14),
+    skipping the SDK's validation and `json.dumps`. A websocket that can't send bytes as
+    text falls back to `connection.send`.
+    """
+    if raw_websocket:
+        websocket = getattr(connection, "_connection", None)
+        if websocket is not None and _sends_bytes_as_text(type(websocket)):
+            await websocket.send(message, text=True)
+            return
+
+    audio = bytes(message[len(AppendEncoder.PREFIX) : len(message) - len(AppendEncoder.SUFFIX)])
+    await connection.send({"type": "input_audio_buffer.append", "audio": audio.decode("ascii")})
+
+
+class MicCapture:
+    """Callback-driven microphone capture.
+
+    PortAudio hands every block to `_callback` on its own thread, which copies it into a
+    pooled buffer and schedules it onto the event loop with `call_soon_threadsafe`.
+    Consumers simply await the bounded queue, so an idle session sleeps instead of polling
+    `read_available`, and hand each frame back with `release` once it has been consumed.
+    When the consumer falls behind the oldest frame is dropped and counted.
+    """
+
+    def __init__(self, frame_s: float = MIC_FRAME_S, max_frames: int = MIC_QUEUE_FRAMES):
+        self.frame_size = int(SAMPLE_RATE * frame_s)
+        self.queue: asyncio.Queue[np.ndarray] = asyncio.Queue(maxsize=max_frames)
+        self.pool = FramePool(self.frame_size, max_frames + 2)
+        self.dropped_frames = 0
+        self.stream: sd.InputStream | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.stream = sd.InputStream(
+            channels=CHANNELS,
+            samplerate=SAMPLE_RATE,
+            dtype="int16",
+            blocksize=self.frame_size,
+            callback=self._callback,
+        )
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def _callback(self, indata, frames, time, status):  # noqa
+        # indata is reused by PortAudio once the callback returns
+        if frames == self.frame_size:
+            frame = self.pool.acquire()
+            frame[:] = indata[:, 0]
+        else:
+            frame = indata[:, 0].copy()
+        try:
+            self._loop.call_soon_threadsafe(self._put, frame)
+        except RuntimeError:
+            # the event loop has already been closed
+            pass
+
+    def _put(self, frame: np.ndarray):
+        if self.queue.full():
+            self.pool.release(self.queue.get_nowait())
+            self.dropped_frames += 1
+        self.queue.put_nowait(frame)
+
+    def release(self, frame: np.ndarray) -> None:
+        """Return a consumed frame to the pool; it must not be used afterwards."""
+        self.pool.release(frame)
+
+    async def read(self) -> np.ndarray:
+        return await self.queue.get()
+
+    async def __aenter__(self) -> MicCapture:
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.stop()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> np.ndarray:
+        return await self.queue.get()
+
+
+class AudioPacketizer:
+    """Coalesces mic frames into `input_audio_buffer.append` messages of `packet_ms` each.
+
+    Frames are copied into a preallocated packet buffer, so callers may release them as
+    soon as `add` returns, and messages are built by an `AppendEncoder`. Call `flush` when
+    the turn ends (push-to-talk release, commit) so the tail of the utterance goes out
+    immediately instead of waiting for a full packet. `raw_websocket` is passed on to
+    `send_append`.
+    """
+
+    def __init__(self, connection: AsyncRealtimeConnection, packet_ms: float = PACKET_MS, raw_websocket: bool = False):
+        self.connection = connection
+        self.raw_websocket = raw_websocket
+        self.packet_bytes = int(SAMPLE_RATE * packet_ms / 1000) * CHANNELS * 2
+        # room for a full packet plus the frame that overshoots it
+        self._pending = np.empty(2 * self.packet_bytes, dtype=np.uint8)
+        self._fill = 0
+        self._encoder = AppendEncoder(len(self._pending))
+        self._send_lock = asyncio.Lock()
+        self._started = time.monotonic()
+
+        self.messages = 0
+        self.audio_bytes = 0
+        self.wire_bytes = 0
+
+    async def add(self, frame: np.ndarray | bytes) -> None:
+        data = memoryview(frame).cast("B")
+        if self._fill + len(data) > len(self._pending):
+            await self.flush()
+            if len(data) > len(self._pending):
+                self._pending = np.empty(len(data), dtype=np.uint8)
+
+        self._pending[self._fill : self._fill + len(data)] = data
+        self._fill += len(data)
+        if self._fill >= self.packet_bytes:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._fill:
+            return
+
+        # the encoder's envelope is reused, so one message at a time
+        async with self._send_lock:
+            audio_bytes = self._fill
+            if not audio_bytes:
+                return
+            message = self._encoder.encode(self._pending[:audio_bytes])
+            self._fill = 0
+
+            await send_append(self.connection, message, self.raw_websocket)
+            self.messages += 1
+            self.audio_bytes += audio_bytes
+            self.wire_bytes += len(message)
+
+    def stats(self) -> dict[str, float]:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "messages": self.messages,
+            "audio_bytes": self.audio_bytes,
+            "wire_bytes": self.wire_bytes,
+            "messages_per_s": self.messages / elapsed,
+            "wire_bytes_per_s": self.wire_bytes / elapsed,
+            "encoder_resizes": self._encoder.resizes,
+        }
+
+
+class VadGate:
+    """Client-side voice activity gate for the upload path.
+
+    Mic frames (10, 20 or 30 ms) are classified with webrtcvad and only speech is
+    forwarded, together with up to `preroll_ms` of audio before each onset and
+    `hangover_ms` after the last speech frame. Keep the hangover above the server VAD's
+    `silence_duration_ms` (500 ms by default) so server-side turn detection still sees
+    the pause that ends the turn.
+    """
+
+    def __init__(self, aggressiveness: int = 2, preroll_ms: int = 200, hangover_ms: int = 600, frame_ms: int = 20):
+        import webrtcvad  # type: ignore
+
+        self.vad = webrtcvad.Vad(aggressiveness)
+        # the pre-roll holds copies, so callers can release their mic frames right away
+        self._preroll: deque[np.ndarray] = deque(maxlen=max(preroll_ms // frame_ms, 0))
+        self._pool: FramePool | None = None
+        self._lent: list[np.ndarray] = []
+        self._hangover_frames = hangover_ms // frame_ms
+        self._hangover = 0
+        self.active = False
+
+        self.uploaded_s = 0.0
+        self.suppressed_s = 0.0
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        samples = frame.reshape(-1)
+        usable = len(samples) - len(samples) % 3
+        narrowband = samples[:usable].reshape(-1, 3).mean(axis=1).astype(np.int16)
+        return self.vad.is_speech(narrowband.tobytes(), VAD_SAMPLE_RATE)
+
+    def process(self, frame: np.ndarray) -> list[np.ndarray]:
+        """Return the frames to upload for this mic frame, possibly none.
+
+        Returned pre-roll frames are only valid until the next call.
+        """
+        duration = len(frame) / SAMPLE_RATE
+        if self._pool is None:
+            self._pool = FramePool(len(frame), (self._preroll.maxlen or 0) + 1)
+        for lent in self._lent:
+            self._pool.release(lent)
+        self._lent.clear()
+
+        if self.is_speech(frame):
+            self._hangover = self._hangover_frames
+            released = []
+            if not self.active:
+                # the pre-roll was counted as suppressed when it arrived
+                released = list(self._preroll)
+                self._preroll.clear()
+                self._lent.extend(released)
+                preroll_s = sum(len(f) for f in released) / SAMPLE_RATE
+                self.suppressed_s -= preroll_s
+                self.uploaded_s += preroll_s
+                self.active = True
+            released.append(frame)
+            self.uploaded_s += duration
+            return released
+
+        if self.active:
+            self._hangover -= 1
+            if self._hangover <= 0:
+                self.active = False
+            self.uploaded_s += duration
+            return [frame]
+
+        if self._preroll.maxlen:
+            if len(self._preroll) == self._preroll.maxlen:
+                self._pool.release(self._preroll[0])
+            copy = self._pool.acquire()
+            copy[:] = frame.reshape(-1)
+            self._preroll.append(copy)
+        self.suppressed_s += duration
+        return []
+
+    def stats(self) -> dict[str, float]:
+        total = self.uploaded_s + self.suppressed_s
+        return {
+            "uploaded_s": self.uploaded_s,
+            "suppressed_s": self.suppressed_s,
+            "suppressed_ratio": self.suppressed_s / total if total else 0.0,
+        }
+
+
 async def send_audio_worker_sounddevice(
     connection: AsyncRealtimeConnection,
     should_send: Callable[[], bool] | None = None,
     start_send: Callable[[], Awaitable[None]] | None = None,
+    packet_ms: float = PACKET_MS,
+    vad_gate: VadGate | None = None,
 ):
     sent_audio = False
 
     device_info = sd.query_devices()
     print(device_info)
 
-    read_size = int(SAMPLE_RATE * 0.02)
-
-    stream = sd.InputStream(
-        channels=CHANNELS,
-        samplerate=SAMPLE_RATE,
-        dtype="int16",
-    )
-    stream.start()
+    packetizer = AudioPacketizer(connection, packet_ms)
 
     try:
-        while True:
-            if stream.read_available < read_size:
-                await asyncio.sleep(0)
-                continue
-
-            data, _ = stream.read(read_size)
+        async with MicCapture() as mic:
+            async for data in mic:
+                if should_send() if should_send else True:
+                    if not sent_audio and start_send:
+                        await start_send()
+                    if vad_gate is None:
+                        await packetizer.add(data)
+                    else:
+                        for frame in vad_gate.process(data):
+                            await packetizer.add(frame)
+                        if not vad_gate.active:
+                            await packetizer.flush()
+                    sent_audio = True
 
-            if should_send() if should_send else True:
-                if not sent_audio and start_send:
-                    await start_send()
-                await connection.send(
-                    {"type": "input_audio_buffer.append", "audio": base64.b64encode(data).decode("utf-8")}
-                )
-                sent_audio = True
+                elif sent_audio:
+                    print("Done, triggering inference")
+                    await packetizer.flush()
+                    await connection.send({"type": "input_audio_buffer.commit"})
+                    await connection.send({"type": "response.create", "response": {}})
+                    sent_audio = False
 
-            elif sent_audio:
-                print("Done, triggering inference")
-                await connection.send({"type": "input_audio_buffer.commit"})
-                await connection.send({"type": "response.create", "response": {}})
-                sent_audio = False
-
-            await asyncio.sleep(0)
+                mic.release(data)
 
     except KeyboardInterrupt:
         pass
-    finally:
-        stream.stop()
-        stream.close()
\ No newline at end of file
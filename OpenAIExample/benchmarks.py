@@ -0,0 +1,238 @@
+"""Throughput benchmarks for the hot paths of the realtime agent.
+
+Run from this directory, e.g. `python benchmarks.py resample`.
+"""
+from __future__ import annotations
+
+import io
+import time
+import wave
+import argparse
+from typing import Callable
+
+
+def _best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_resample(seconds: float = 30.0, repeat: int = 3) -> None:
+    """In-process polyphase conversion vs. the pydub/ffmpeg path, in multiples of realtime."""
+    import numpy as np
+
+    import audio_util
+
+    rng = np.random.default_rng(0)
+    for rate, channels in [(8000, 1), (16000, 1), (44100, 2), (48000, 2)]:
+        pcm = rng.integers(-8000, 8000, int(rate * seconds) * channels, dtype=np.int16).tobytes()
+        wav_bytes = io.BytesIO()
+        with wave.open(wav_bytes, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(pcm)
+
+        numpy_s = _best_of(lambda: audio_util.convert_pcm16(pcm, rate, channels), repeat)
+        line = f"{rate:>6} Hz x{channels}: numpy {seconds / numpy_s:8.0f}x realtime"
+        try:
+            pydub_s = _best_of(lambda: audio_util._pydub_to_pcm16(wav_bytes.getvalue()), repeat)
+            line += f", pydub {seconds / pydub_s:8.0f}x realtime"
+        except (OSError, RuntimeError) as e:
+            line += f", pydub unavailable ({e})"
+        print(line)
+
+
+def bench_frames(frames: int = 5000) -> None:
+    """Capture-to-wire cost per 20 ms mic frame: SDK dict path vs. pooled buffers and in-place encoding."""
+    import json
+    import base64
+    import asyncio
+    import tracemalloc
+
+    import numpy as np
+    from openai._utils import async_maybe_transform
+    from openai.types.beta.realtime import RealtimeClientEventParam
+
+    import audio_util
+
+    frame_size = int(audio_util.SAMPLE_RATE * audio_util.MIC_FRAME_S)
+    indata = np.random.default_rng(0).integers(-8000, 8000, (frame_size, 1), dtype=np.int16)
+    pool = audio_util.FramePool(frame_size, 4)
+    encoder = audio_util.AppendEncoder(frame_size * 2)
+
+    async def legacy() -> None:
+        # what `input_audio_buffer.append(audio=...)` does before the websocket write
+        data = indata.copy()
+        event = {"type": "input_audio_buffer.append", "audio": base64.b64encode(data).decode("utf-8")}
+        json.dumps(await async_maybe_transform(event, RealtimeClientEventParam))
+
+    async def pooled() -> None:
+        frame = pool.acquire()
+        frame[:] = indata[:, 0]
+        encoder.encode(frame.view(np.uint8))
+        pool.release(frame)
+
+    async def run() -> None:
+        for name, step in [("copy + b64encode + SDK send", legacy), ("frame pool + AppendEncoder", pooled)]:
+            started = time.perf_counter()
+            for _ in range(frames):
+                await step()
+            per_frame_us = (time.perf_counter() - started) / frames * 1e6
+
+            tracemalloc.start()
+            for _ in range(100):
+                await step()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:>28}: {per_frame_us:6.1f} us/frame, peak transient {peak:6d} bytes")
+
+    asyncio.run(run())
+    print(f"pool: {pool.acquired} frames acquired, {pool.allocations} allocations, encoder resizes: {encoder.resizes}")
+
+
+def bench_db(seconds: float = 3.0, writers: int = 2, readers: int = 4) -> None:
+    """Concurrent bookings and day lookups: sqlite defaults vs. `configure_engine` (WAL, synchronous=NORMAL)."""
+    import os
+    import tempfile
+    import threading
+
+    from appointment_model import AppointmentDBHandler
+
+    doctors = [f"D{i}" for i in range(20)]
+
+    def run(configure: bool) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            db_name = os.path.join(directory, "hospital.db")
+            setup = AppointmentDBHandler(db_name, configure=configure)
+            setup.cursor.executemany(
+                "INSERT INTO doctors (doctor_id, name, specialization) VALUES (?, ?, ?)",
+                [(doctor_id, f"Doctor {doctor_id}", "Cardiology") for doctor_id in doctors],
+            )
+            setup.connection.commit()
+            setup.close()
+
+            stop = threading.Event()
+            writes: list[int] = []
+            read_latencies: list[float] = []
+            errors: list[Exception] = []
+
+            def writer(index: int) -> None:
+                handler = AppointmentDBHandler(db_name, create_tables=False, configure=configure)
+                done = 0
+                day = 0
+                while not stop.is_set():
+                    date = f"2030-{1 + day // 28 % 12:02d}-{1 + day % 28:02d} {9 + done % 3}:00:00"
+                    try:
+                        with handler.transaction():
+                            handler.book_appointment(f"P{index}", "", "", date, doctor_id=doctors[done % len(doctors)])
+                        done += 1
+                    except Exception as e:
+                        errors.append(e)
+                    day += 1
+                writes.append(done)
+                handler.close()
+
+            def reader(index: int) -> None:
+                handler = AppointmentDBHandler(db_name, create_tables=False, configure=configure)
+                latencies = []
+                day = index
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        handler._available_slots_for(doctors[day % len(doctors)], f"2030-01-{1 + day % 28:02d}")
+                    except Exception as e:
+                        errors.append(e)
+                    latencies.append(time.perf_counter() - started)
+                    day += 1
+                read_latencies.extend(latencies)
+                handler.close()
+
+            threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+            threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        read_latencies.sort()
+        p99 = read_latencies[int(len(read_latencies) * 0.99)] * 1000 if read_latencies else 0.0
+        label = "WAL + synchronous=NORMAL" if configure else "sqlite defaults"
+        print(
+            f"{label:>25}: {sum(writes) / seconds:8.0f} bookings/s, {len(read_latencies) / seconds:8.0f} reads/s, "
+            f"read p99 {p99:6.2f} ms, {len(errors)} errors"
+        )
+
+    run(configure=False)
+    run(configure=True)
+
+
+# Date arguments in the shapes the model sends to book_appointment / update_appointment,
+# ISO first and foremost, with the same few slots asked about again and again
+DATE_CORPUS = [
+    "2025-01-15 16:00:00", "2025-01-15 16:00:00", "2025-01-16 10:00:00", "2025-01-15 4:00 PM",
+    "2025-01-16 10:00:00 AM", "15/01/2025 16:00:00", "16-01-2025 10:00:00", "January 15, 2025 4:00 PM",
+    "16 January 2025 10:00 AM", "2025-01-15T16:00", "2025-01-16T10:00AM", "2025-01-17 09:00:00",
+    "2025-01-17 09:00:00", "tomorrow at 5pm", "next Monday 10am", "2025-01-15 16:00",
+]
+
+
+def _legacy_convert_to_standard_format(input_date: str) -> str | None:
+    """`convert_to_standard_format` before the shape dispatch: every format in turn until one parses."""
+    from datetime import datetime
+
+    supported_formats = [
+        "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %I:%M:%S %p", "%Y-%m-%d %I:%M %p", "%d/%m/%Y %H:%M:%S",
+        "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %I:%M:%S %p", "%d-%m-%Y %I:%M:%S %p", "%d/%m/%Y %I:%M %p",
+        "%d-%m-%Y %I:%M %p", "%B %d, %Y %I:%M %p", "%d %B %Y %I:%M %p", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%I:%M%p",
+    ]
+    for fmt in supported_formats:
+        try:
+            return datetime.strptime(input_date, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def bench_dates(rounds: int = 2000) -> None:
+    """Date argument normalization: the strptime loop vs. regex shape dispatch, cold and cached."""
+    import appointment_model
+
+    corpus = DATE_CORPUS * rounds
+    legacy_s = _best_of(lambda: [_legacy_convert_to_standard_format(d) for d in corpus], 3)
+
+    def uncached() -> None:
+        for d in corpus:
+            appointment_model._parse_date.cache_clear()
+            appointment_model.convert_to_standard_format(d)
+
+    dispatch_s = _best_of(uncached, 3)
+    cached_s = _best_of(lambda: [appointment_model.convert_to_standard_format(d) for d in corpus], 3)
+
+    for name, elapsed in [("strptime loop", legacy_s), ("shape dispatch", dispatch_s), ("shape dispatch, cached", cached_s)]:
+        print(f"{name:>22}: {elapsed / len(corpus) * 1e6:6.2f} us/date")
+    print(f"cache: {appointment_model._parse_date.cache_info()}")
+
+
+BENCHMARKS: dict[str, Callable[[], None]] = {
+    "resample": bench_resample,
+    "frames": bench_frames,
+    "db": bench_db,
+    "dates": bench_dates,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=[*BENCHMARKS, "all"])
+    options = parser.parse_args()
+
+    for name, bench in BENCHMARKS.items():
+        if options.benchmark in (name, "all"):
+            print(f"== {name}")
+            bench()
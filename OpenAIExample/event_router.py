@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import time
+import inspect
+import logging
+from typing import Any, Union, Callable, Awaitable
+from collections import deque, defaultdict
+
+log = logging.getLogger(__name__)
+
+SLOW_HANDLER_S = 0.05
+LATENCY_SAMPLES = 1000  # per event type, for the percentiles
+
+Handler = Callable[[Any], Union[Awaitable[None], None]]
+
+
+class HandlerStats:
+    """Count and latency of the handlers run for one event type."""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self.count = 0
+        self.slow = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self._latencies: deque[float] = deque(maxlen=samples)
+
+    def record(self, elapsed: float, slow: bool) -> None:
+        self.count += 1
+        self.slow += slow
+        self.total_s += elapsed
+        self.max_s = max(self.max_s, elapsed)
+        self._latencies.append(elapsed)
+
+    def percentile(self, q: float) -> float:
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "slow": self.slow,
+            "mean_ms": self.total_s / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max_s * 1000,
+        }
+
+
+class EventRouter:
+    """Dispatches realtime server events to handlers subscribed by event type.
+
+    Handlers are plain functions or coroutine functions taking the event. Events are
+    handled one at a time in arrival order, so a slow handler holds up everything behind
+    it, audio deltas included: every dispatch is timed per event type and handlers
+    slower than `slow_handler_s` are logged.
+    """
+
+    def __init__(self, slow_handler_s: float = SLOW_HANDLER_S, samples: int = LATENCY_SAMPLES):
+        self.slow_handler_s = slow_handler_s
+        self._samples = samples
+        self._handlers: defaultdict[str, list[Handler]] = defaultdict(list)
+        self.stats: dict[str, HandlerStats] = {}
+
+    def subscribe(self, event_type: str, handler: Handler) -> None:
+        self._handlers[event_type].append(handler)
+
+    def on(self, event_type: str) -> Callable[[Handler], Handler]:
+        """Decorator form of `subscribe`."""
+
+        def decorator(handler: Handler) -> Handler:
+            self.subscribe(event_type, handler)
+            return handler
+
+        return decorator
+
+    async def dispatch(self, event: Any) -> bool:
+        """Run the handlers for `event`, returns False when nothing is subscribed to its type."""
+        handlers = self._handlers.get(event.type)
+        if not handlers:
+            return False
+
+        started = time.perf_counter()
+        for handler in handlers:
+            result = handler(event)
+            if inspect.isawaitable(result):
+                await result
+        elapsed = time.perf_counter() - started
+
+        stats = self.stats.get(event.type)
+        if stats is None:
+            stats = self.stats[event.type] = HandlerStats(self._samples)
+        slow = elapsed > self.slow_handler_s
+        stats.record(elapsed, slow)
+        if slow:
+            log.warning("Slow handler for %s: %.1f ms", event.type, elapsed * 1000)
+        return True
+
+    async def run(self, connection: Any) -> None:
+        """Dispatch every event of `connection` until it closes."""
+        async for event in connection:
+            await self.dispatch(event)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {event_type: stats.summary() for event_type, stats in self.stats.items()}
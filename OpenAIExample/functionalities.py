@@ -77,5 +77,24 @@ tools = [
                 "description": "The department or specialty of the doctor (e.g., Cardiology, Orthopedics)."
             },
         }
+    },
+    {
+        "type": "function",
+        "name": "find_earliest_slot",
+        "description": "Find the earliest available appointment slot with any doctor of a specialization.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "specialization": {
+                "type": "string",
+                "description": "The department or specialty of the doctor (e.g., Cardiology, Orthopedics)."
+                },
+                "days": {
+                "type": "integer",
+                "description": "How many days ahead to search, starting today. Defaults to 14."
+                }
+            },
+            "required": ["specialization"]
+        }
     }
 ]
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""Bulk import of clinic rosters and appointment history into the appointment database.
+
+    python import_data.py patients patients.csv
+    python import_data.py doctors doctors.jsonl --db hospital.db
+    python import_data.py appointments history.csv --batch-size 20000
+
+CSV files need a header row, JSONL files one object per line. The columns are:
+patients: name, age, contact; doctors: name, specialization;
+appointments: patient_id, doctor_id, appointment_date.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import time
+import argparse
+from typing import Any, Iterator
+from itertools import islice
+
+from appointment_model import AppointmentDBHandler
+
+IMPORT_BATCH_SIZE = 50000
+
+COLUMNS: dict[str, tuple[str, ...]] = {
+    "patients": ("name", "age", "contact"),
+    "doctors": ("name", "specialization"),
+    "appointments": ("patient_id", "doctor_id", "appointment_date"),
+}
+
+
+def read_records(path: str) -> Iterator[dict[str, Any]]:
+    """Yield the records of a .csv or .jsonl file as dicts."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        elif path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"Unsupported file type: {path}, expected .csv or .jsonl")
+
+
+def import_file(handler: AppointmentDBHandler, kind: str, path: str, batch_size: int = IMPORT_BATCH_SIZE) -> dict[str, float]:
+    """Import `path` into the `kind` table, one transaction per batch. Returns the row counts and rate."""
+    columns = COLUMNS[kind]
+    bulk_insert = {
+        "patients": handler.add_patients,
+        "doctors": handler.add_doctors,
+        "appointments": handler.add_appointments,
+    }[kind]
+
+    rows = (tuple(record.get(column) for column in columns) for record in read_records(path))
+    read = inserted = 0
+    started = time.perf_counter()
+    while batch := list(islice(rows, batch_size)):
+        read += len(batch)
+        inserted += bulk_insert(batch)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "read": read,
+        "inserted": inserted,
+        "skipped": read - inserted,
+        "seconds": elapsed,
+        "rows_per_s": read / elapsed if elapsed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=list(COLUMNS))
+    parser.add_argument("path")
+    parser.add_argument("--db", default="hospital.db")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    options = parser.parse_args()
+
+    handler = AppointmentDBHandler(options.db)
+    try:
+        result = import_file(handler, options.kind, options.path, options.batch_size)
+    finally:
+        handler.close()
+
+    print(
+        f"{options.kind}: {result['read']} rows read, {result['inserted']} inserted, "
+        f"{result['skipped']} skipped in {result['seconds']:.2f}s ({result['rows_per_s']:.0f} rows/s)"
+    )
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import json
+import asyncio
+import logging
+from typing import Any, Callable
+
+from tool_executor import ToolExecutor
+from appointment_model import AppointmentDBPool, AppointmentDBHandler
+
+log = logging.getLogger(__name__)
+
+
+class PartialArguments:
+    """Incremental parser for the JSON object streamed in `function_call_arguments.delta` events.
+
+    Each delta is scanned once. `feed` returns the top-level fields whose values became
+    complete with that delta, so a field can be acted on while the model is still
+    streaming the rest of the object.
+    """
+
+    def __init__(self) -> None:
+        self.fields: dict[str, Any] = {}
+        self._text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start: int | None = None
+        self._key: str | None = None
+
+    def feed(self, delta: str) -> dict[str, Any]:
+        completed: dict[str, Any] = {}
+        offset = len(self._text)
+        self._text += delta
+
+        for i in range(offset, len(self._text)):
+            ch = self._text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close(i + 1, completed)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._start = i
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._start = i
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._close(i + 1, completed)
+                elif self._depth == 0 and self._start is not None:
+                    # a number or literal ended by the closing brace
+                    self._close(i, completed)
+            elif self._depth == 1:
+                if ch == "," and self._start is not None:
+                    self._close(i, completed)
+                elif self._start is None and ch not in " \t\r\n:,":
+                    self._start = i
+
+        return completed
+
+    def _close(self, end: int, completed: dict[str, Any]) -> None:
+        assert self._start is not None
+        raw = self._text[self._start:end]
+        self._start = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self._key = None
+            return
+
+        if self._key is None:
+            self._key = value if isinstance(value, str) else None
+        else:
+            self.fields[self._key] = completed[self._key] = value
+            self._key = None
+
+
+class Prefetch:
+    """A read-only lookup started as soon as `fields` of a tool's arguments are complete, its
+    result is passed to the tool as the `kwarg` keyword argument."""
+
+    def __init__(self, kwarg: str, fields: tuple[str, ...], fetch: Callable[..., Any]):
+        self.kwarg = kwarg
+        self.fields = fields
+        self.fetch = fetch
+
+
+# Only lookups that no tool call can invalidate: doctors are never removed, so an id read
+# outside the tool's transaction is still valid inside it. Rows a tool writes, such as the
+# appointment being rescheduled, must be read within its transaction instead.
+PREFETCHES: dict[str, list[Prefetch]] = {
+    "book_appointment": [
+        Prefetch("doctor_id", ("doctor_name", "specialization"), AppointmentDBHandler.get_doctor_id),
+    ],
+}
+
+
+class Prefetcher:
+    """Speculative lookups for tool calls whose arguments are still streaming.
+
+    Lookups run on the tool executor with a pooled handler. When the call is made, a
+    lookup is a hit only if the final arguments still match the values it was started
+    with; otherwise its result is dropped and the tool does the lookup itself.
+    """
+
+    def __init__(self, executor: ToolExecutor, db_pool: AppointmentDBPool, prefetches: dict[str, list[Prefetch]] = PREFETCHES):
+        self.executor = executor
+        self.db_pool = db_pool
+        self.prefetches = prefetches
+        self._arguments: dict[str, PartialArguments] = {}
+        self._started: dict[str, dict[str, tuple[tuple[Any, ...], asyncio.Task[Any]]]] = {}
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+
+    def feed(self, call_id: str, function_name: str, delta: str) -> None:
+        prefetches = self.prefetches.get(function_name)
+        if not prefetches:
+            return
+
+        arguments = self._arguments.setdefault(call_id, PartialArguments())
+        if not arguments.feed(delta):
+            return
+
+        started = self._started.setdefault(call_id, {})
+        for prefetch in prefetches:
+            if prefetch.kwarg in started or not all(field in arguments.fields for field in prefetch.fields):
+                continue
+            values = tuple(arguments.fields[field] for field in prefetch.fields)
+            task = asyncio.create_task(self._fetch(f"prefetch:{prefetch.kwarg}", prefetch.fetch, values))
+            started[prefetch.kwarg] = (values, task)
+            self.started += 1
+
+    async def _fetch(self, name: str, fetch: Callable[..., Any], values: tuple[Any, ...]) -> Any:
+        def run() -> Any:
+            with self.db_pool.checkout() as dbhandler:
+                return fetch(dbhandler, *values)
+
+        return await self.executor.run(name, run)
+
+    async def take(self, call_id: str, function_name: str, args: Any) -> dict[str, Any]:
+        """Keyword arguments from the prefetches of `call_id` that match its final `args`."""
+        self._arguments.pop(call_id, None)
+        started = self._started.pop(call_id, None)
+        if not started:
+            return {}
+
+        try:
+            final = json.loads(args) if isinstance(args, str) else dict(args or {})
+        except (TypeError, ValueError):
+            final = {}
+
+        kwargs: dict[str, Any] = {}
+        for prefetch in self.prefetches.get(function_name, []):
+            if prefetch.kwarg not in started:
+                continue
+            values, task = started[prefetch.kwarg]
+            if values != tuple(final.get(field) for field in prefetch.fields):
+                self.misses += 1
+                continue
+            try:
+                result = await task
+            except Exception as e:
+                log.warning("Prefetch of %s for %s failed: %s", prefetch.kwarg, call_id, e)
+                result = None
+            if result is None:
+                self.misses += 1
+                continue
+            kwargs[prefetch.kwarg] = result
+            self.hits += 1
+        return kwargs
+
+    def retain(self, call_ids: set[str]) -> None:
+        """Forget the calls not in `call_ids`, e.g. of a response that was cancelled."""
+        for call_id in set(self._arguments) - call_ids:
+            del self._arguments[call_id]
+        for call_id in set(self._started) - call_ids:
+            del self._started[call_id]
+
+    def stats(self) -> dict[str, float]:
+        used = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / used if used else 0.0,
+        }
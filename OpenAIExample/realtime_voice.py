@@ -24,25 +24,48 @@
 from __future__ import annotations
 import json
 
-import base64
+import time
 import asyncio
-from typing import Any, cast
+import logging
+from collections import OrderedDict
+from typing import Any
 from typing_extensions import override
 
+from rich.text import Text
 from textual import events
-from audio_util import CHANNELS, SAMPLE_RATE, AudioPlayerAsync
+from audio_util import PACKET_MS, SAMPLE_RATE, VadGate, AudioPacketizer, AudioPlayerAsync, MicCapture
 from textual.app import App, ComposeResult
-from textual.widgets import Button, Static, RichLog
+from textual.widgets import Button, Static
 from textual.reactive import reactive
-from textual.containers import Container
+from textual.containers import Container, VerticalScroll
 
 from openai import AsyncOpenAI
+from openai.types.beta.realtime import (
+    ResponseDoneEvent,
+    ResponseOutputItemAddedEvent,
+    ResponseFunctionCallArgumentsDoneEvent,
+    ResponseFunctionCallArgumentsDeltaEvent,
+    SessionCreatedEvent,
+    SessionUpdatedEvent,
+    ResponseAudioDoneEvent,
+    ResponseAudioDeltaEvent,
+    ResponseAudioTranscriptDeltaEvent,
+    InputAudioBufferSpeechStartedEvent,
+    InputAudioBufferSpeechStoppedEvent,
+)
 from openai.types.beta.realtime.session import Session
 from openai.resources.beta.realtime.realtime import AsyncRealtimeConnection
 
+from event_router import EventRouter
+from tool_executor import TOOL_WORKERS, ToolExecutor, HeadStartStats, ToolTimeoutError
+from prefetch import Prefetcher
 from functionalities import tools
-from appointment_model import AppointmentDBHandler
+from appointment_model import SlotIndex, AppointmentDBPool, AppointmentDBHandler
 
+log = logging.getLogger(__name__)
+
+# tools without side effects, the only ones started before their response is known to complete
+READ_ONLY_TOOLS = frozenset({"list_availabe_slots", "find_earliest_slot"})
 
 class SessionDisplay(Static):
     """A widget that shows the current session ID."""
@@ -67,6 +90,54 @@ class AudioStatusIndicator(Static):
         return status
 
 
+class TranscriptPane(VerticalScroll):
+    """A scrolling transcript that appends deltas and repaints at a capped frame rate.
+
+    Every response item gets its own `Static`. Deltas are buffered per item and only the
+    items that changed are updated on the next refresh tick, and only the most recent
+    `max_items` items are kept.
+    """
+
+    def __init__(self, max_items: int = 50, max_fps: float = 15, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.max_items = max_items
+        self.max_fps = max_fps
+        self._items: OrderedDict[str, tuple[Static, list[str]]] = OrderedDict()
+        self._dirty: set[str] = set()
+
+    def on_mount(self) -> None:
+        self.set_interval(1 / self.max_fps, self._refresh_items)
+
+    def append(self, item_id: str, delta: str) -> None:
+        if item_id not in self._items:
+            widget = Static()
+            self._items[item_id] = (widget, [])
+            self.mount(widget)
+            while len(self._items) > self.max_items:
+                _, (evicted, _) = self._items.popitem(last=False)
+                evicted.remove()
+
+        self._items[item_id][1].append(delta)
+        self._dirty.add(item_id)
+
+    def _refresh_items(self) -> None:
+        if not self._dirty:
+            return
+
+        for item_id in self._dirty:
+            if item_id not in self._items:
+                continue
+            widget, chunks = self._items[item_id]
+            # collapse the deltas so each tick joins one string plus what arrived since
+            text = "".join(chunks)
+            chunks[:] = [text]
+            # a Text, not a str, so brackets in the transcript are never parsed as markup
+            widget.update(Text(text))
+
+        self._dirty.clear()
+        self.scroll_end(animate=False)
+
+
 class RealtimeApp(App[None]):
     CSS = """
         Screen {
@@ -129,32 +200,75 @@ class RealtimeApp(App[None]):
     should_send_audio: asyncio.Event
     audio_player: AudioPlayerAsync
     last_audio_item_id: str | None
+    audio_done_item_id: str | None
+    interrupted_item_id: str | None
     connection: AsyncRealtimeConnection | None
+    packetizer: AudioPacketizer | None
+    vad_gate: VadGate | None
     session: Session | None
     connected: asyncio.Event
-
-    def __init__(self) -> None:
+    router: EventRouter
+    tool_executor: ToolExecutor
+    db_pool: AppointmentDBPool
+    call_names: dict[str, str]
+    pending_tools: dict[str, asyncio.Task[tuple[str, float, float]]]
+    head_start: HeadStartStats
+    prefetcher: Prefetcher
+    transcript: TranscriptPane
+
+    def __init__(self, packet_ms: float = PACKET_MS, vad_gate: VadGate | None = None) -> None:
         super().__init__()
         self.connection = None
+        self.packet_ms = packet_ms
+        self.packetizer = None
+        self.vad_gate = vad_gate
         self.session = None
         self.client = AsyncOpenAI()
         self.audio_player = AudioPlayerAsync()
         self.last_audio_item_id = None
+        self.audio_done_item_id = None
+        self.interrupted_item_id = None
         self.should_send_audio = asyncio.Event()
         self.connected = asyncio.Event()
 
+        self.tool_executor = ToolExecutor(max_workers=TOOL_WORKERS)
+        # one handler per tool worker, a tool call never waits for a connection
+        self.db_pool = AppointmentDBPool(size=TOOL_WORKERS, slot_index=SlotIndex())
+        self.call_names = {}
+        self.pending_tools = {}
+        self.head_start = HeadStartStats()
+        self.prefetcher = Prefetcher(self.tool_executor, self.db_pool)
+
+        self.router = EventRouter()
+        self.router.subscribe("session.created", self.handle_session_created)
+        self.router.subscribe("session.updated", self.handle_session_updated)
+        self.router.subscribe("input_audio_buffer.speech_started", self.handle_speech_started)
+        self.router.subscribe("input_audio_buffer.speech_stopped", self.handle_speech_stopped)
+        self.router.subscribe("response.audio.delta", self.handle_audio_delta)
+        self.router.subscribe("response.audio.done", self.handle_audio_done)
+        self.router.subscribe("response.audio_transcript.delta", self.handle_transcript_delta)
+        self.router.subscribe("response.output_item.added", self.handle_output_item_added)
+        self.router.subscribe("response.function_call_arguments.delta", self.handle_arguments_delta)
+        self.router.subscribe("response.function_call_arguments.done", self.handle_arguments_done)
+        self.router.subscribe("response.done", self.handle_response_done)
+
     @override
     def compose(self) -> ComposeResult:
         """Create child widgets for the app."""
         with Container():
             yield SessionDisplay(id="session-display")
             yield AudioStatusIndicator(id="status-indicator")
-            yield RichLog(id="bottom-pane", wrap=True, highlight=True, markup=True)
+            yield TranscriptPane(id="bottom-pane")
 
     async def on_mount(self) -> None:
         self.run_worker(self.handle_realtime_connection())
         self.run_worker(self.send_mic_audio())
 
+    def on_unmount(self) -> None:
+        # a tool still running past its timeout must not keep the process alive
+        self.tool_executor.shutdown(wait=False)
+        self.db_pool.close()
+
     async def handle_realtime_connection(self) -> None:
         async with self.client.beta.realtime.connect(model="gpt-4o-realtime-preview-2024-10-01") as conn:
             self.connection = conn
@@ -171,82 +285,124 @@ class RealtimeApp(App[None]):
                 "tool_choice": "auto",
             })
 
-            acc_items: dict[str, Any] = {}
+            self.transcript = self.query_one("#bottom-pane", TranscriptPane)
+            await self.router.run(conn)
 
-            async for event in conn:
-                if event.type == "session.created":
-                    self.session = event.session
-                    session_display = self.query_one(SessionDisplay)
-                    assert event.session.id is not None
-                    session_display.session_id = event.session.id
-                    continue
+    def handle_session_created(self, event: SessionCreatedEvent) -> None:
+        self.session = event.session
+        session_display = self.query_one(SessionDisplay)
+        assert event.session.id is not None
+        session_display.session_id = event.session.id
 
-                if event.type == "session.updated":
-                    self.session = event.session
-                    continue
+    def handle_session_updated(self, event: SessionUpdatedEvent) -> None:
+        self.session = event.session
 
-                if event.type == "response.audio.delta":
-                    if event.item_id != self.last_audio_item_id:
-                        self.audio_player.reset_frame_count()
-                        self.last_audio_item_id = event.item_id
+    def handle_speech_started(self, event: InputAudioBufferSpeechStartedEvent) -> None:
+        # server VAD heard the caller, it cancels the response itself. The flush takes up to
+        # a playback block, wait for it in a task so the router moves on to the next event
+        asyncio.create_task(self.barge_in(cancel_response=False))
 
-                    bytes_data = base64.b64decode(event.delta)
-                    self.audio_player.add_data(bytes_data)
-                    continue
+    async def handle_speech_stopped(self, event: InputAudioBufferSpeechStoppedEvent) -> None:
+        # turn ended, don't hold the tail of the utterance back for a full packet
+        if self.packetizer is not None:
+            await self.packetizer.flush()
 
-                if event.type == "response.audio_transcript.delta":
-                    try:
-                        text = acc_items[event.item_id]
-                    except KeyError:
-                        acc_items[event.item_id] = event.delta
-                    else:
-                        acc_items[event.item_id] = text + event.delta
-
-                    # Clear and update the entire content because RichLog otherwise treats each delta as a new line
-                    bottom_pane = self.query_one("#bottom-pane", RichLog)
-                    bottom_pane.clear()
-                    bottom_pane.write(acc_items[event.item_id])
-                    continue
-
-                if event.type == "response.done":
-                    output_type = None
-                    output_name = None
-                    output_arguments = None
-                    call_id = None
-                    response = None
-                    # Extract output for the specific functionality
-                    if event.response.output:  # Check if the output list is not empty
-                        if getattr(event.response.output[0], 'type', None) == 'function_call':
-                            output_name = getattr(event.response.output[0], 'name', None)
-                            output_arguments = getattr(event.response.output[0], 'arguments', None)
-                            call_id = getattr(event.response.output[0], 'call_id', None)
-
-                            response = self.handle_functions(function_name=output_name, args=output_arguments)
-
-                            await conn.conversation.item.create(item=(
-                                {
-                                    "type": "function_call_output",
-                                    "call_id": call_id,
-                                    "output": response
-                                }
-                            ))
-
-                            await conn.response.create()
-
-                    # print(f"Functionality: {functionality['type']}")
-                    # bottom_pane = self.query_one("#bottom-pane", RichLog)
-                    # bottom_pane.write(f"Response : {response}")
-                    continue
-
-    def handle_functions(self,function_name:str, args):
-
-        dbhandler = AppointmentDBHandler()
+    def handle_audio_delta(self, event: ResponseAudioDeltaEvent) -> None:
+        if event.item_id == self.interrupted_item_id:
+            # late deltas of a reply the caller already talked over
+            return
+
+        if event.item_id != self.last_audio_item_id:
+            self.audio_player.reset_frame_count()
+            self.last_audio_item_id = event.item_id
+
+        self.audio_player.add_base64(event.delta)
+
+    def handle_audio_done(self, event: ResponseAudioDoneEvent) -> None:
+        # all of the item's audio has arrived, once the player drains there is nothing left to truncate
+        self.audio_done_item_id = event.item_id
+
+    def handle_transcript_delta(self, event: ResponseAudioTranscriptDeltaEvent) -> None:
+        self.transcript.append(event.item_id, event.delta)
+
+    def handle_output_item_added(self, event: ResponseOutputItemAddedEvent) -> None:
+        # the arguments events carry the call id but not the function name
+        if event.item.type == "function_call" and event.item.call_id and event.item.name:
+            self.call_names[event.item.call_id] = event.item.name
+
+    def handle_arguments_delta(self, event: ResponseFunctionCallArgumentsDeltaEvent) -> None:
+        # look up what the call will need while the model is still streaming the arguments
+        name = self.call_names.get(event.call_id)
+        if name is not None:
+            self.prefetcher.feed(event.call_id, name, event.delta)
+
+    def handle_arguments_done(self, event: ResponseFunctionCallArgumentsDoneEvent) -> None:
+        # start reads now rather than when the rest of the response has streamed in. Writes wait
+        # for response.done, a response cancelled by a barge-in must not leave a booking behind
+        name = self.call_names.pop(event.call_id, None)
+        if name in READ_ONLY_TOOLS:
+            self.pending_tools[event.call_id] = asyncio.create_task(
+                self._timed_tool(name, event.arguments, event.call_id)
+            )
+
+    async def handle_response_done(self, event: ResponseDoneEvent) -> None:
+        done_at = time.perf_counter()
+        pending, self.pending_tools = self.pending_tools, {}
+        self.call_names.clear()
+
+        # the model may emit several calls in one response, e.g. cancel one slot and book another
+        calls = [item for item in event.response.output or [] if getattr(item, 'type', None) == 'function_call']
+        self.prefetcher.retain({call.call_id for call in calls})
+        if not calls:
+            if pending:
+                # only reads are started early, there is nothing to undo
+                log.info("Response %s ended without the calls %s it started", event.response.status, list(pending))
+            return
+
+        conn = await self._get_connection()
+        tasks = [
+            pending.pop(call.call_id, None)
+            or asyncio.create_task(self._timed_tool(call.name, call.arguments, call.call_id))
+            for call in calls
+        ]
+        results = await asyncio.gather(*tasks)
+
+        saved = self.head_start.record(done_at, [(started, finished) for _, started, finished in results])
+        log.info("Tool calls of response %s: %.1f ms saved by starting early", event.response.id, saved * 1000)
+
+        for call, (response, _, _) in zip(calls, results):
+            await conn.conversation.item.create(item=(
+                {
+                    "type": "function_call_output",
+                    "call_id": call.call_id,
+                    "output": response
+                }
+            ))
+
+        # one follow-up turn for all of the outputs
+        await conn.response.create()
+
+    async def _timed_tool(self, function_name: str, args, call_id: str) -> tuple[str, float, float]:
+        started = time.perf_counter()
+        prefetched = await self.prefetcher.take(call_id, function_name, args)
+        response = await self.run_tool(function_name=function_name, args=args, prefetched=prefetched)
+        return response, started, time.perf_counter()
+
+    async def run_tool(self, function_name: str, args, prefetched: dict[str, Any] | None = None) -> str:
+        """Run `handle_functions` on the tool executor so the database work doesn't block audio."""
+        try:
+            return await self.tool_executor.run(function_name, self.handle_functions, function_name, args, prefetched)
+        except ToolTimeoutError as e:
+            return f"Error: {e}."
+
+    def handle_functions(self,function_name:str, args, prefetched=None):
 
         functions = {
-            "book_appointment": dbhandler.book_appointment,
-            "update_appointment": dbhandler.reschedule_appointment,
-            "cancel_appointment": dbhandler.cancel_appointment,
-            "list_availabe_slots": dbhandler.get_available_appointments
+            "book_appointment": AppointmentDBHandler.book_appointment,
+            "update_appointment": AppointmentDBHandler.reschedule_appointment,
+            "cancel_appointment": AppointmentDBHandler.cancel_appointment,
+            "list_availabe_slots": AppointmentDBHandler.get_available_appointments,
+            "find_earliest_slot": AppointmentDBHandler.find_earliest_slot
         }
 
         if function_name not in functions:
@@ -259,20 +415,49 @@ class RealtimeApp(App[None]):
             if isinstance(args, str):
                 args = json.loads(args)
 
-            result = functions[function_name](**args)
+            with self.db_pool.checkout() as dbhandler:
+                if function_name in READ_ONLY_TOOLS:
+                    # under WAL a read sees the last commit and doesn't wait for the write lock
+                    result = functions[function_name](dbhandler, **args, **(prefetched or {}))
+                else:
+                    # the checks and writes of one tool call commit together
+                    with dbhandler.transaction():
+                        result = functions[function_name](dbhandler, **args, **(prefetched or {}))
             return f"{result}"
         except TypeError as e:
             return f"Error calling {function_name} with args {args}. Error: {str(e)}"
         except Exception as e:
             return f"An error occurred while executing {function_name}: {str(e)}"
-        finally:
-            dbhandler.close()
 
     async def _get_connection(self) -> AsyncRealtimeConnection:
         await self.connected.wait()
         assert self.connection is not None
         return self.connection
 
+    async def barge_in(self, cancel_response: bool = True) -> None:
+        """Stop local playback and truncate the server-side item to the audio the caller actually heard."""
+        connection = await self._get_connection()
+        item_id = self.last_audio_item_id
+        if item_id is not None and item_id == self.audio_done_item_id and not self.audio_player.buffer.available():
+            # the reply already finished playing, the server's copy is what the caller heard
+            self.last_audio_item_id = item_id = None
+        if item_id is not None:
+            # drop the item's late deltas from here on, not only once the flush is done
+            self.interrupted_item_id = item_id
+            self.last_audio_item_id = None
+
+        played_frames = await self.audio_player.interrupt()
+
+        if cancel_response:
+            await connection.send({"type": "response.cancel"})
+
+        if item_id is not None:
+            await connection.conversation.item.truncate(
+                item_id=item_id,
+                content_index=0,
+                audio_end_ms=played_frames * 1000 // SAMPLE_RATE,
+            )
+
     async def send_mic_audio(self) -> None:
         import sounddevice as sd  # type: ignore
 
@@ -281,41 +466,43 @@ class RealtimeApp(App[None]):
         device_info = sd.query_devices()
         print(device_info)
 
-        read_size = int(SAMPLE_RATE * 0.02)
-
-        stream = sd.InputStream(
-            channels=CHANNELS,
-            samplerate=SAMPLE_RATE,
-            dtype="int16",
-        )
-        stream.start()
-
         status_indicator = self.query_one(AudioStatusIndicator)
 
         try:
-            while True:
-                if stream.read_available < read_size:
-                    await asyncio.sleep(0)
-                    continue
-
-                await self.should_send_audio.wait()
-                status_indicator.is_recording = True
-
-                data, _ = stream.read(read_size)
-
-                connection = await self._get_connection()
-                if not sent_audio:
-                    asyncio.create_task(connection.send({"type": "response.cancel"}))
-                    sent_audio = True
-
-                await connection.input_audio_buffer.append(audio=base64.b64encode(cast(Any, data)).decode("utf-8"))
-
-                await asyncio.sleep(0)
+            async with MicCapture() as mic:
+                async for data in mic:
+                    try:
+                        if not self.should_send_audio.is_set():
+                            # not recording, drop the frame; the next key press starts a new turn
+                            # that may talk over the assistant
+                            sent_audio = False
+                            if self.packetizer is not None:
+                                await self.packetizer.flush()
+                            continue
+
+                        status_indicator.is_recording = True
+
+                        connection = await self._get_connection()
+                        if self.packetizer is None:
+                            self.packetizer = AudioPacketizer(connection, self.packet_ms)
+                        if not sent_audio:
+                            asyncio.create_task(self.barge_in())
+                            sent_audio = True
+
+                        if self.vad_gate is None:
+                            await self.packetizer.add(data)
+                            continue
+
+                        # only speech plus padding goes upstream, close packets as soon as the gate shuts
+                        for frame in self.vad_gate.process(data):
+                            await self.packetizer.add(frame)
+                        if not self.vad_gate.active:
+                            await self.packetizer.flush()
+                    finally:
+                        # the packetizer and VAD gate keep their own copies
+                        mic.release(data)
         except KeyboardInterrupt:
             pass
-        finally:
-            stream.stop()
-            stream.close()
 
     async def on_key(self, event: events.Key) -> None:
         """Handle key press events."""
@@ -333,6 +520,9 @@ class RealtimeApp(App[None]):
                 self.should_send_audio.clear()
                 status_indicator.is_recording = False
 
+                if self.packetizer is not None:
+                    await self.packetizer.flush()
+
                 if self.session and self.session.turn_detection is None:
                     # The default in the API is that the model will automatically detect when the user has
                     # stopped talking and then start responding itself.
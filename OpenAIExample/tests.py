@@ -1,7 +1,17 @@
 import unittest
 from datetime import datetime, timedelta
 import sqlite3
-from appointment_model import AppointmentDBHandler  # Replace with the correct module name
+import os
+import json
+import tempfile
+import asyncio
+import threading
+from unittest import mock
+from appointment_model import AppointmentDBHandler, AppointmentDBPool, SlotIndex, convert_to_standard_format  # Replace with the correct module name
+from prefetch import PartialArguments
+from event_router import EventRouter, HandlerStats
+from tool_executor import ToolExecutor, HeadStartStats, ToolTimeoutError
+from import_data import import_file
 
 class TestAppointmentDBHandler(unittest.TestCase):
 
@@ -103,6 +113,82 @@ class TestAppointmentDBHandler(unittest.TestCase):
         cancel_result = self.db_handler.cancel_appointment(appointment_id)
         self.assertIn("successfully canceled", cancel_result)
 
+    def test_lookups_use_indexes(self):
+        """
+        Test that the lookups the handler runs are index searches, not table scans.
+        """
+        self.db_handler.add_doctor(name="Smith", specialization="Cardiology")
+        date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+        # the statements as executed, with their parameters bound
+        statements = []
+        self.db_handler.connection.set_trace_callback(statements.append)
+        try:
+            self.db_handler.add_patient(name="John Doe", age=30, contact=1234567890)
+            self.db_handler.get_patient_by_contact(contact=1234567890)
+            doctor_id = self.db_handler.get_doctor_id(name="Dr. Smith", specialization="Cardiology")
+            self.db_handler._query_slots(doctor_id, date)
+            result = self.db_handler.book_appointment(
+                patient_id="P1",
+                doctor_name="Smith",
+                specialization="Cardiology",
+                appointment_date=f"{date} 10:00:00",
+                doctor_id=doctor_id
+            )
+            appointment_id = result.split("ID ")[1].split(" ")[0]
+            self.db_handler.reschedule_appointment(appointment_id, f"{date} 11:00:00")
+            self.db_handler.cancel_appointment(appointment_id)
+        finally:
+            self.db_handler.connection.set_trace_callback(None)
+
+        lookups = [statement for statement in statements if "WHERE" in statement]
+        tables = {table for table in ("patients", "doctors", "appointments") for statement in lookups if table in statement}
+        self.assertEqual(tables, {"patients", "doctors", "appointments"})
+        for statement in lookups:
+            plan = " ".join(row[-1] for row in self.db_handler.connection.execute(f"EXPLAIN QUERY PLAN {statement}"))
+            self.assertIn("USING", plan, f"{statement} -> {plan}")
+            self.assertNotIn("SCAN", plan, f"{statement} -> {plan}")
+
+    def test_bulk_inserts_skip_duplicates(self):
+        """
+        Test that bulk inserts skip rows already in the table and rows repeated within the batch.
+        """
+        self.db_handler.add_patient(name="John Doe", age=30, contact=1234567890)
+        inserted = self.db_handler.add_patients([
+            ("John Doe", 30, 1234567890),
+            ("Jane Doe", 40, 1112223333),
+            ("Jane Doe", 40, 1112223333),
+            ("Jane Doe", 41, 4445556666),
+        ])
+        self.assertEqual(inserted, 2)
+        self.assertEqual(self.db_handler.add_doctors([("Smith", "Cardiology"), ("Smith", "Orthopedics"), ("Smith", "Cardiology")]), 2)
+
+        inserted = self.db_handler.add_appointments([
+            ("P1", "D1", "2025-01-15 10:00:00"),
+            ("P2", "D1", "2025-01-15 10:00:00"),
+            ("P2", "D1", "2025-01-15 11:00 AM"),
+            ("P3", "D2", "not a date"),
+        ])
+        self.assertEqual(inserted, 2)
+        self.assertEqual(len(self.db_handler._available_slots_for("D1", "2025-01-15")), 5)
+
+    def test_import_file(self):
+        """
+        Test importing a CSV roster, twice.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "patients.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("name,age,contact\nJohn Doe,30,1234567890\nJane Doe,40,1112223333\n")
+
+            result = import_file(self.db_handler, "patients", path, batch_size=1)
+            self.assertEqual((result["read"], result["inserted"]), (2, 2))
+            result = import_file(self.db_handler, "patients", path)
+            self.assertEqual((result["read"], result["inserted"]), (2, 0))
+
+        patient = self.db_handler.get_patient_by_contact(contact=1112223333)
+        self.assertEqual(patient[1], "Jane Doe", "Patient name should match.")
+
     def test_get_patient_by_contact(self):
         """
         Test retrieving patient details by contact number.
@@ -112,5 +198,450 @@ class TestAppointmentDBHandler(unittest.TestCase):
         self.assertIsNotNone(patient, "Patient should not be None.")
         self.assertEqual(patient[1], "John Doe", "Patient name should match.")
 
+class TestAppointmentDBPool(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a pool over a temporary database file, shared by all its handlers.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool = AppointmentDBPool(db_name=os.path.join(self.directory.name, "hospital.db"), size=3)
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+    def test_handlers_share_schema_and_data(self):
+        """
+        Test that writes through one handler are visible through the others.
+        """
+        with self.pool.checkout() as first, self.pool.checkout() as second:
+            self.assertIsNot(first, second)
+            first.add_patient(name="John Doe", age=30, contact=1234567890)
+            patient = second.get_patient_by_contact(contact=1234567890)
+        self.assertEqual(patient[1], "John Doe", "Patient name should match.")
+
+    def test_checkout_from_threads(self):
+        """
+        Test that handlers can be used from worker threads and are all returned.
+        """
+        errors = []
+
+        def work(contact):
+            try:
+                with self.pool.checkout(timeout=5) as handler:
+                    handler.add_patient(name="Jane Doe", age=40, contact=contact)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(contact,)) for contact in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = self.pool.stats()
+        self.assertEqual(stats["checkouts"], 12)
+        self.assertEqual(stats["idle"], 3)
+
+    def test_unhealthy_handler_is_replaced(self):
+        """
+        Test that a handler whose connection died is swapped for a fresh one on checkout.
+        """
+        self.pool.health_check_s = 0
+        with self.pool.checkout() as handler:
+            handler.close()
+        with self.pool.checkout() as handler:
+            self.assertTrue(handler.ping())
+        self.assertEqual(self.pool.stats()["replaced"], 1)
+
+    def test_transaction_commits_once(self):
+        """
+        Test that writes inside a (nested) transaction commit together and roll back together.
+        """
+        with self.pool.checkout() as writer, self.pool.checkout() as reader:
+            with writer.transaction():
+                writer.add_patient(name="John Doe", age=30, contact=1)
+                with writer.transaction():
+                    writer.add_patient(name="Jane Doe", age=40, contact=2)
+                self.assertIsNone(reader.get_patient_by_contact(contact=1), "Uncommitted write should not be visible.")
+            self.assertIsNotNone(reader.get_patient_by_contact(contact=2))
+
+            with self.assertRaises(RuntimeError):
+                with writer.transaction():
+                    writer.add_patient(name="Jim Doe", age=50, contact=3)
+                    raise RuntimeError("tool failed")
+            self.assertIsNone(reader.get_patient_by_contact(contact=3), "Rolled back write should not be visible.")
+
+    def test_slot_cache_invalidated_by_writes(self):
+        """
+        Test that cached slots are reused and dropped when the doctor-day is booked, rescheduled or canceled.
+        """
+        with self.pool.checkout() as handler:
+            handler.cursor.execute("INSERT INTO doctors VALUES ('D1', 'Smith', 'Cardiology')")
+            handler.connection.commit()
+            date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+            other_date = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+
+            self.assertEqual(len(handler._available_slots_for("D1", date)), 7)
+            self.assertEqual(len(handler._available_slots_for("D1", date)), 7)
+            self.assertEqual(self.pool.slot_cache.hits, 1)
+
+            result = handler.book_appointment(
+                patient_id="P1",
+                doctor_name="Smith",
+                specialization="Cardiology",
+                appointment_date=f"{date} 10:00:00",
+                doctor_id="D1"
+            )
+            appointment_id = result.split("ID ")[1].split(" ")[0]
+            self.assertEqual(len(handler._available_slots_for("D1", date)), 6)
+
+            self.assertEqual(len(handler._available_slots_for("D1", other_date)), 7)
+            handler.reschedule_appointment(appointment_id, f"{other_date} 10:00:00")
+            self.assertEqual(len(handler._available_slots_for("D1", date)), 7)
+            self.assertEqual(len(handler._available_slots_for("D1", other_date)), 6)
+
+            handler.cancel_appointment(appointment_id)
+            self.assertEqual(len(handler._available_slots_for("D1", other_date)), 7)
+
+class TestSlotIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db_handler = AppointmentDBHandler(db_name=":memory:", slot_index=SlotIndex())
+        self.db_handler.add_doctors([("Smith", "Cardiology"), ("Jones", "Cardiology"), ("Brown", "Orthopedics")])
+        self.doctor_ids = dict(self.db_handler.cursor.execute("SELECT name, doctor_id FROM doctors"))
+        self.date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    def tearDown(self):
+        self.db_handler.close()
+
+    def book(self, name, date):
+        return self.db_handler.book_appointment(
+            patient_id="P1",
+            doctor_name=name,
+            specialization="Cardiology",
+            appointment_date=date,
+            doctor_id=self.doctor_ids[name]
+        )
+
+    def test_matches_query(self):
+        """
+        Test that slot listings from the bitmaps match the ones computed from the table, through writes.
+        """
+        smith = self.doctor_ids["Smith"]
+        self.db_handler.add_appointments([(f"P{hour}", smith, f"{self.date} {hour}:00:00") for hour in (9, 13, 16)])
+        self.assertEqual(self.db_handler._available_slots_for(smith, self.date), self.db_handler._query_slots(smith, self.date))
+
+        result = self.book("Smith", f"{self.date} 10:00:00")
+        appointment_id = result.split("ID ")[1].split(" ")[0]
+        self.assertFalse(self.db_handler._slot_is_free(smith, f"{self.date} 10:00:00"))
+        self.assertEqual(self.db_handler._available_slots_for(smith, self.date), self.db_handler._query_slots(smith, self.date))
+
+        self.db_handler.cancel_appointment(appointment_id)
+        self.assertTrue(self.db_handler._slot_is_free(smith, f"{self.date} 10:00:00"))
+        self.assertEqual(len(self.db_handler._available_slots_for(smith, self.date)), 4)
+
+    def test_rolled_back_write_not_indexed(self):
+        """
+        Test that a booking rolled back with its transaction leaves the slot free in the index.
+        """
+        smith = self.doctor_ids["Smith"]
+        self.assertTrue(self.db_handler._slot_is_free(smith, f"{self.date} 10:00:00"))
+        with self.assertRaises(RuntimeError):
+            with self.db_handler.transaction():
+                self.book("Smith", f"{self.date} 10:00:00")
+                raise RuntimeError("tool failed")
+        self.assertTrue(self.db_handler._slot_is_free(smith, f"{self.date} 10:00:00"))
+
+    def test_earliest_free_across_doctors(self):
+        """
+        Test the earliest free slot search over all doctors of a specialization.
+        """
+        index = self.db_handler.slot_index
+        smith, jones = self.doctor_ids["Smith"], self.doctor_ids["Jones"]
+        start = datetime.strptime(f"{self.date} 10:30:00", "%Y-%m-%d %H:%M:%S")
+
+        self.assertEqual(index.earliest_free(self.db_handler, [smith, jones], start, 3), (smith, start.replace(hour=11, minute=0)))
+
+        self.db_handler.add_appointments([(f"P{hour}", smith, f"{self.date} {hour}:00:00") for hour in (11, 13, 14, 15, 16)])
+        self.db_handler.add_appointments([(f"P{hour}", jones, f"{self.date} {hour}:00:00") for hour in (11, 13)])
+        self.assertEqual(index.earliest_free(self.db_handler, [smith, jones], start, 3), (jones, start.replace(hour=14, minute=0)))
+
+        self.db_handler.add_appointments([(f"P{hour}", jones, f"{self.date} {hour}:00:00") for hour in (14, 15, 16)])
+        next_day = (start + timedelta(days=1)).replace(hour=9, minute=0)
+        self.assertEqual(index.earliest_free(self.db_handler, [smith, jones], start, 3), (smith, next_day))
+        self.assertIsNone(index.earliest_free(self.db_handler, [smith, jones], start, 1))
+
+        result = self.db_handler.find_earliest_slot("Orthopedics", days=2)
+        self.assertIn("Earliest available slot is with Dr. Brown", result)
+
+    def test_pool_skips_slot_cache(self):
+        """
+        Test that a pool with a slot index keeps no slot cache to invalidate.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            pool = AppointmentDBPool(db_name=os.path.join(directory, "hospital.db"), size=2, slot_index=SlotIndex())
+            try:
+                self.assertIsNone(pool.slot_cache)
+                with pool.checkout() as handler:
+                    self.assertIsNone(handler.slot_cache)
+                    self.assertEqual(len(handler._available_slots_for("D1", self.date)), 7)
+                self.assertIsNone(pool.stats()["slot_cache"])
+            finally:
+                pool.close()
+
+class TestDoctorNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db_handler = AppointmentDBHandler(db_name=":memory:")
+        self.db_handler.add_doctors([("John Smith", "Cardiology"), ("Jane Smith", "Cardiology"), ("Maria Garcia", "Orthopedics")])
+        self.doctor_ids = dict(self.db_handler.cursor.execute("SELECT name, doctor_id FROM doctors"))
+
+    def tearDown(self):
+        self.db_handler.close()
+
+    def test_resolves_clear_matches(self):
+        """
+        Test that misheard names resolve to the doctor they were meant for.
+        """
+        self.assertEqual(self.db_handler.get_doctor_id("Dr. Jon Smith", "Cardiology"), self.doctor_ids["John Smith"])
+        self.assertEqual(self.db_handler.get_doctor_id("garcia", "Orthopedics"), self.doctor_ids["Maria Garcia"])
+        self.assertIsNone(self.db_handler.get_doctor_id("Garcia", "Cardiology"), "Specialization should be respected.")
+
+    def test_ambiguous_names_are_not_guessed(self):
+        """
+        Test that a name matching several doctors equally well is left to the caller.
+        """
+        self.assertIsNone(self.db_handler.get_doctor_id("Smith", "Cardiology"))
+        candidates = self.db_handler.find_doctors("Smith", "Cardiology")
+        self.assertEqual({candidate.name for candidate in candidates}, {"John Smith", "Jane Smith"})
+
+        result = self.db_handler.book_appointment(
+            patient_id="P1",
+            doctor_name="Smith",
+            specialization="Cardiology",
+            appointment_date="2030-01-15 10:00:00"
+        )
+        self.assertIn("did you mean", result)
+
+    def test_listing_slots_adds_no_doctor(self):
+        """
+        Test that listing the slots of an unknown or ambiguous doctor only reads.
+        """
+        date = "2030-01-15"
+        result = self.db_handler.get_available_appointments("Smith", "Cardiology", date)
+        self.assertIn("did you mean", result)
+        result = self.db_handler.get_available_appointments("Linh Nguyen", "Dermatology", date)
+        self.assertIn("not found", result)
+        self.assertEqual(self.db_handler.cursor.execute("SELECT COUNT(*) FROM doctors").fetchone()[0], 3)
+        self.assertFalse(self.db_handler.connection.in_transaction)
+
+        slots = self.db_handler.get_available_appointments("Dr. Jon Smith", "Cardiology", date)
+        self.assertEqual(len(slots), 7)
+
+    def test_index_follows_add_doctor(self):
+        """
+        Test that doctors added after the index was loaded are found.
+        """
+        self.assertEqual(self.db_handler.find_doctors("Nguyen"), [])
+        self.db_handler.add_doctor(name="Linh Nguyen", specialization="Dermatology")
+        self.assertEqual(self.db_handler.find_doctors("Dr. Nguyen")[0].name, "Linh Nguyen")
+
+class TestConvertToStandardFormat(unittest.TestCase):
+
+    def test_absolute_formats(self):
+        """
+        Test every supported absolute format, and inputs no format accepts.
+        """
+        for text in [
+            "2025-10-10 16:00:00", "2025-10-10 4:00:00 PM", "2025-10-10 4:00 PM", "10/10/2025 16:00:00",
+            "10-10-2025 16:00:00", "10/10/2025 4:00:00 PM", "10-10-2025 4:00:00 PM", "10/10/2025 4:00 PM",
+            "10-10-2025 4:00 PM", "October 10, 2025 4:00 PM", "10 October 2025 4:00 PM", "2025-10-10T16:00",
+            "2025-10-10T4:00PM", " 2025-10-10 16:00:00 ",
+        ]:
+            self.assertEqual(convert_to_standard_format(text), "2025-10-10 16:00:00", text)
+
+        for text in ["2025-10-10 16:00", "2025-13-10 16:00:00", "2025-10-10 13:00 PM", "Octember 10, 2025 4:00 PM", "soon", ""]:
+            self.assertIsNone(convert_to_standard_format(text), text)
+
+    def test_relative_phrases(self):
+        """
+        Test the relative phrases callers use, against today's date.
+        """
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        fmt = "%Y-%m-%d %H:%M:%S"
+        self.assertEqual(convert_to_standard_format("tomorrow at 5pm"), (today + timedelta(days=1, hours=17)).strftime(fmt))
+        self.assertEqual(convert_to_standard_format("Today at noon"), (today + timedelta(hours=12)).strftime(fmt))
+        self.assertEqual(convert_to_standard_format("in 3 days at 14:30"), (today + timedelta(days=3, hours=14, minutes=30)).strftime(fmt))
+
+        next_monday = convert_to_standard_format("next Monday 10am")
+        monday = datetime.strptime(next_monday, fmt)
+        self.assertEqual((monday.weekday(), monday.hour), (0, 10))
+        self.assertTrue(1 <= (monday - today).days <= 7)
+
+        self.assertIsNone(convert_to_standard_format("tomorrow at 13pm"))
+        self.assertIsNone(convert_to_standard_format("in 99999999 days at 5pm"))
+        self.assertIsNone(convert_to_standard_format("in 9999999999999999999999 days at 5pm"))
+
+        db_handler = AppointmentDBHandler(db_name=":memory:")
+        try:
+            db_handler.add_doctor(name="Smith", specialization="Cardiology")
+            result = db_handler.book_appointment(
+                patient_id="P1",
+                doctor_name="Smith",
+                specialization="Cardiology",
+                appointment_date="in 99999999 days at 5pm"
+            )
+        finally:
+            db_handler.close()
+        self.assertIn("is not a supported date", result)
+
+class TestPartialArguments(unittest.TestCase):
+
+    def test_fields_complete_while_streaming(self):
+        """
+        Test that each field is reported by the delta that completes it, whatever the delta boundaries.
+        """
+        arguments = '{"doctor_name": "Dr. \\"Smith\\"", "slots": [10, "}"], "specialization": "Cardiology", "age": 30}'
+        for size in (1, 4, 16):
+            parser = PartialArguments()
+            completed = []
+            for start in range(0, len(arguments), size):
+                completed.extend(parser.feed(arguments[start:start + size]))
+            self.assertEqual(completed, ["doctor_name", "slots", "specialization", "age"])
+            self.assertEqual(parser.fields, json.loads(arguments))
+
+class TestEventRouter(unittest.TestCase):
+
+    def test_dispatch(self):
+        """
+        Test that plain and coroutine handlers run in subscription order, and unrouted events are reported.
+        """
+        router = EventRouter()
+        calls = []
+
+        @router.on("response.audio.delta")
+        def first(event):
+            calls.append(("first", event.delta))
+
+        async def second(event):
+            await asyncio.sleep(0)
+            calls.append(("second", event.delta))
+
+        router.subscribe("response.audio.delta", second)
+
+        async def dispatch():
+            routed = await router.dispatch(mock.Mock(type="response.audio.delta", delta="abc"))
+            unrouted = await router.dispatch(mock.Mock(type="response.text.delta"))
+            return routed, unrouted
+
+        self.assertEqual(asyncio.run(dispatch()), (True, False))
+        self.assertEqual(calls, [("first", "abc"), ("second", "abc")])
+        self.assertEqual(list(router.summary()), ["response.audio.delta"])
+
+    def test_percentiles(self):
+        """
+        Test the latency summary over the recorded samples.
+        """
+        stats = HandlerStats(samples=100)
+        for ms in range(200, 0, -1):
+            stats.record(ms / 1000, slow=ms > 150)
+
+        summary = stats.summary()
+        self.assertEqual((summary["count"], summary["slow"]), (200, 50))
+        self.assertAlmostEqual(summary["mean_ms"], 100.5)
+        self.assertAlmostEqual(summary["max_ms"], 200)
+        # only the last 100 samples, 1..100 ms, count towards the percentiles
+        self.assertAlmostEqual(summary["p50_ms"], 51)
+        self.assertAlmostEqual(summary["p99_ms"], 100)
+        self.assertEqual(HandlerStats().percentile(50), 0.0)
+
+    def test_slow_handler_warning(self):
+        """
+        Test that handlers slower than `slow_handler_s` are counted and logged.
+        """
+        router = EventRouter(slow_handler_s=0.01)
+
+        async def slow(event):
+            await asyncio.sleep(0.02)
+
+        router.subscribe("response.done", slow)
+        router.subscribe("response.audio.delta", lambda event: None)
+
+        async def dispatch():
+            await router.dispatch(mock.Mock(type="response.audio.delta"))
+            await router.dispatch(mock.Mock(type="response.done"))
+
+        with self.assertLogs("event_router", level="WARNING") as logs:
+            asyncio.run(dispatch())
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("response.done", logs.output[0])
+        self.assertEqual(router.stats["response.done"].slow, 1)
+        self.assertEqual(router.stats["response.audio.delta"].slow, 0)
+
+class TestToolExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ToolExecutor(max_workers=2, timeout_s=5, tool_timeouts={"slow": 0.05})
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def blocked(self):
+        self.release.wait(5)
+        return "late"
+
+    def test_results_and_stats(self):
+        """
+        Test that calls return their result or raise their error, and are timed per tool.
+        """
+        def fail():
+            raise ValueError("no such doctor")
+
+        async def run():
+            result = await self.executor.run("add", lambda a, b: a + b, 1, b=2)
+            with self.assertRaises(ValueError):
+                await self.executor.run("add", fail)
+            return result
+
+        self.assertEqual(asyncio.run(run()), 3)
+        summary = self.executor.summary()["add"]
+        self.assertEqual((summary["calls"], summary["errors"], summary["timeouts"]), (2, 1, 0))
+
+    def test_timeout(self):
+        """
+        Test that a call past its tool's timeout raises `ToolTimeoutError` without waiting for the thread.
+        """
+        async def run():
+            with self.assertRaises(ToolTimeoutError) as raised:
+                await self.executor.run("slow", self.blocked)
+            return raised.exception
+
+        error = asyncio.run(run())
+        self.assertEqual((error.name, error.timeout_s), ("slow", 0.05))
+        self.assertEqual(self.executor.stats["slow"].timeouts, 1)
+
+class TestHeadStartStats(unittest.TestCase):
+
+    def test_saved_time(self):
+        """
+        Test the tool time hidden per turn, from when each call started and finished relative to `response.done`.
+        """
+        stats = HeadStartStats()
+        # one call started 2 s early and finished 1 s after response.done, one started after it
+        self.assertAlmostEqual(stats.record(10.0, [(8.0, 11.0), (10.5, 12.0)]), 1.5)
+        self.assertAlmostEqual(stats.record(20.0, [(20.0, 20.5)]), 0.0)
+        self.assertAlmostEqual(stats.record(30.0, [(29.0, 29.5)]), 0.5, msg="A call done before response.done is all saved.")
+
+        summary = stats.summary()
+        self.assertEqual((summary["turns"], summary["calls"], summary["early_calls"]), (3, 4, 2))
+        self.assertAlmostEqual(summary["mean_saved_ms"], 2000 / 3)
+        self.assertAlmostEqual(summary["max_saved_ms"], 1500)
+        self.assertAlmostEqual(summary["mean_remaining_ms"], 2000 / 3)
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
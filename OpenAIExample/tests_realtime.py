@@ -0,0 +1,776 @@
+"""
+Tests of the audio pipeline and the realtime app. These need PyAudio, sounddevice (and the
+PortAudio library) and textual, the appointment tests in tests.py only need the standard library.
+"""
+import unittest
+import os
+import sys
+import json
+import base64
+import wave
+import tempfile
+import asyncio
+import threading
+import time
+import numpy as np
+from types import SimpleNamespace
+from unittest import mock
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+from audio_util import SAMPLE_RATE, Resampler, RingBuffer, JitterBuffer, AudioCache, AudioPlayerAsync, MicCapture, AudioPacketizer, VadGate, FramePool, AppendEncoder, send_append, convert_pcm16, iter_pcm16_file
+from tool_executor import ToolExecutor, HeadStartStats
+from textual.app import App
+from realtime_voice import READ_ONLY_TOOLS, RealtimeApp, TranscriptPane
+from functionalities import tools
+from appointment_model import AppointmentDBPool, AppointmentDBHandler
+
+# audio_agent.py lives at the repository root, next to this directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_agent import UtteranceSegmenter
+
+class TestAudioFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def failing_decoder(self):
+        """
+        A stand-in for ffmpeg that reports an error and exits non-zero.
+        """
+        path = os.path.join(self.directory.name, "ffmpeg")
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\necho 'Invalid data found when processing input' >&2\nexit 1\n")
+        os.chmod(path, 0o755)
+        return mock.patch.object(AudioSegment, "converter", path)
+
+    def write_wav(self, name, samples, rate, channels):
+        path = os.path.join(self.directory.name, name)
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(samples.astype(np.int16).tobytes())
+        return path
+
+    def test_wav_chunks(self):
+        """
+        Test that a 24 kHz mono WAV is streamed as is, in chunks of `chunk_ms`.
+        """
+        samples = np.arange(6000, dtype=np.int16)
+        path = self.write_wav("clip.wav", samples, SAMPLE_RATE, 1)
+        chunks = list(iter_pcm16_file(path, chunk_ms=100))
+        self.assertEqual([len(chunk) for chunk in chunks], [4800, 4800, 2400])
+        self.assertEqual(b"".join(chunks), samples.tobytes())
+
+    def test_wav_resampled(self):
+        """
+        Test that other WAV formats are converted chunk by chunk, to the same audio as a one-shot conversion.
+        """
+        rng = np.random.default_rng(0)
+        samples = rng.integers(-3000, 3000, size=2 * 48000, dtype=np.int16)
+        path = self.write_wav("clip.wav", samples, 48000, 2)
+        chunks = list(iter_pcm16_file(path, chunk_ms=100))
+        self.assertEqual(len(chunks), 10)
+        self.assertEqual(b"".join(chunks), convert_pcm16(samples.tobytes(), 48000, 2))
+
+    def test_failed_decode_raises(self):
+        """
+        Test that a decoder failure is raised with its error output rather than ending the stream.
+        """
+        path = os.path.join(self.directory.name, "clip.mp3")
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+
+        with self.failing_decoder(), self.assertRaises(CouldntDecodeError) as raised:
+            list(iter_pcm16_file(path))
+        self.assertIn("Invalid data", str(raised.exception))
+
+    def test_cache_hits_and_invalidation(self):
+        """
+        Test that decoded audio is served from the cache, across instances, until the source file changes.
+        """
+        path = self.write_wav("clip.wav", np.arange(4000), 16000, 1)
+        directory = os.path.join(self.directory.name, "cache")
+        cache = AudioCache(directory)
+
+        first = cache.load(path)
+        np.testing.assert_array_equal(first, np.frombuffer(convert_pcm16(np.arange(4000, dtype=np.int16).tobytes(), 16000, 1), dtype=np.int16))
+        np.testing.assert_array_equal(cache.load(path), first)
+        self.assertEqual(AudioCache(directory).load(path).tobytes(), first.tobytes())
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self.write_wav("clip.wav", np.arange(2000), 16000, 1)
+        self.assertEqual(len(cache.load(path)), 3000)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        chunks = list(cache.iter_chunks(path, chunk_ms=50))
+        self.assertEqual([len(chunk) for chunk in chunks], [2400, 2400, 1200])
+
+    def test_cache_eviction(self):
+        """
+        Test that the least recently used entries are evicted past `max_bytes`, never the one just loaded.
+        """
+        cache = AudioCache(os.path.join(self.directory.name, "cache"), max_bytes=20000)
+        paths = [self.write_wav(f"clip{i}.wav", np.full(4000, i), SAMPLE_RATE, 1) for i in range(3)]
+        for path in paths:
+            cache.load(path)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(len(os.listdir(cache.directory)), 2)
+
+        cache.load(paths[1])
+        self.assertEqual(cache.stats()["hits"], 1)
+        cache.load(paths[0])
+        self.assertEqual(cache.stats()["evictions"], 2)
+        cache.load(paths[1])
+        self.assertEqual(cache.stats()["hits"], 2, "The entry used last should have been kept.")
+
+    def test_failed_decode_not_cached(self):
+        """
+        Test that a failed or missing decoder leaves neither an entry nor a temporary file behind.
+        """
+        path = os.path.join(self.directory.name, "clip.mp3")
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+        cache = AudioCache(os.path.join(self.directory.name, "cache"))
+
+        with self.failing_decoder(), self.assertRaises(CouldntDecodeError):
+            cache.load(path)
+        with mock.patch.object(AudioSegment, "converter", os.path.join(self.directory.name, "missing")):
+            with self.assertRaises(FileNotFoundError):
+                cache.load(path)
+        self.assertEqual(os.listdir(cache.directory), [])
+        self.assertEqual(cache.stats()["hits"], 0)
+
+class TestSendAppend(unittest.TestCase):
+
+    MESSAGE = b'{"type":"input_audio_buffer.append","audio":"AAAA"}'
+
+    class WebSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, message, text=None):
+            self.sent.append((bytes(message), text))
+
+    def test_public_send_by_default(self):
+        """
+        Test that the audio goes through `connection.send` unless the raw websocket is opted into.
+        """
+        connection = mock.Mock(_connection=self.WebSocket(), send=mock.AsyncMock())
+        asyncio.run(send_append(connection, memoryview(self.MESSAGE)))
+        connection.send.assert_awaited_once_with({"type": "input_audio_buffer.append", "audio": "AAAA"})
+        self.assertEqual(connection._connection.sent, [])
+
+    def test_raw_websocket(self):
+        """
+        Test that with `raw_websocket` the prebuilt message is sent to the websocket as a text frame.
+        """
+        connection = mock.Mock(_connection=self.WebSocket(), send=mock.AsyncMock())
+        asyncio.run(send_append(connection, memoryview(self.MESSAGE), raw_websocket=True))
+        self.assertEqual(connection._connection.sent, [(self.MESSAGE, True)])
+        connection.send.assert_not_called()
+
+    def test_raw_websocket_fallback(self):
+        """
+        Test the fallback to `connection.send` for a websocket without the `text` argument.
+        """
+        class WebSocket:
+            async def send(self, message):
+                raise AssertionError("should not be called")
+
+        connection = mock.Mock(_connection=WebSocket(), send=mock.AsyncMock())
+        asyncio.run(send_append(connection, memoryview(self.MESSAGE), raw_websocket=True))
+        connection.send.assert_awaited_once_with({"type": "input_audio_buffer.append", "audio": "AAAA"})
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_wraparound_and_overruns(self):
+        """
+        Test that writes wrap around the ring in order and that what does not fit is dropped and counted.
+        """
+        ring = RingBuffer(8)
+        out = np.empty(4, dtype=np.int16)
+        self.assertEqual(ring.write(np.arange(6, dtype=np.int16)), 6)
+        self.assertEqual(ring.read_into(out), 4)
+        np.testing.assert_array_equal(out, [0, 1, 2, 3])
+
+        self.assertEqual(ring.write(np.arange(6, 12, dtype=np.int16)), 6)
+        self.assertEqual(ring.available(), 8)
+        self.assertEqual(ring.write(np.arange(3, dtype=np.int16)), 0)
+        self.assertEqual((ring.overruns, ring.overrun_frames), (1, 3))
+
+        out = np.full(8, -1, dtype=np.int16)
+        self.assertEqual(ring.read_into(out), 8)
+        np.testing.assert_array_equal(out, np.arange(4, 12))
+
+    def test_underruns(self):
+        """
+        Test that running dry counts one underrun and the missing frames, and is padded with silence.
+        """
+        ring = RingBuffer(8)
+        out = np.full(4, -1, dtype=np.int16)
+        self.assertEqual(ring.read_into(out), 0)
+        self.assertEqual(ring.underruns, 0, "An empty ring that never played is not an underrun.")
+
+        ring.write(np.arange(1, 7, dtype=np.int16))
+        ring.read_into(out)
+        self.assertEqual(ring.read_into(out), 2)
+        np.testing.assert_array_equal(out, [5, 6, 0, 0])
+        self.assertEqual((ring.underruns, ring.underrun_frames), (1, 2))
+
+        ring.read_into(out)
+        self.assertEqual(ring.underruns, 1, "Staying dry is the same underrun.")
+        np.testing.assert_array_equal(out, 0)
+
+class TestJitterBuffer(unittest.TestCase):
+
+    def setUp(self):
+        # a clock the test advances, arrivals and playout are timed with it
+        self.now = 0.0
+        patcher = mock.patch("audio_util.time")
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def test_preroll(self):
+        """
+        Test that playback waits for the pre-roll and releases a short tail once arrivals stop.
+        """
+        jitter = JitterBuffer(SAMPLE_RATE, preroll_ms=60)
+        out = np.full(240, -1, dtype=np.int16)
+        jitter.write(np.ones(960, dtype=np.int16))
+        self.assertEqual(jitter.read_into(out), 0)
+        np.testing.assert_array_equal(out, 0)
+
+        self.now += 0.02
+        jitter.write(np.ones(480, dtype=np.int16))
+        self.assertEqual(jitter.read_into(out), 240, "60 ms are queued, playback starts.")
+
+        # drained, buffering again until the target or until nothing more arrives
+        jitter.read_into(np.empty(2400, dtype=np.int16))
+        jitter.write(np.ones(480, dtype=np.int16))
+        self.assertEqual(jitter.read_into(out), 0)
+        self.now += 0.1
+        self.assertEqual(jitter.read_into(out), 240)
+
+    def test_target_follows_jitter(self):
+        """
+        Test that the playout delay grows with arrival jitter and stays within its bounds.
+        """
+        jitter = JitterBuffer(10 * SAMPLE_RATE, preroll_ms=60, max_delay_ms=400)
+        chunk = np.zeros(480, dtype=np.int16)
+        for _ in range(50):
+            jitter.write(chunk)
+            self.now += 0.02
+        self.assertEqual(jitter.target, int(0.06 * SAMPLE_RATE), "Steady arrivals keep the pre-roll.")
+
+        for i in range(50):
+            jitter.write(chunk)
+            self.now += 0.0 if i % 2 else 0.08
+        self.assertGreater(jitter.target, int(0.06 * SAMPLE_RATE))
+        self.assertLess(jitter.target, int(0.4 * SAMPLE_RATE))
+
+        for i in range(50):
+            jitter.write(chunk)
+            self.now += 0.0 if i % 2 else 0.9
+        self.assertEqual(jitter.target, int(0.4 * SAMPLE_RATE))
+        self.assertEqual(jitter.stats()["target_ms"], 400)
+
+    def test_bursts_keep_preroll(self):
+        """
+        Test that audio arriving faster than real time does not raise the playout delay.
+        """
+        jitter = JitterBuffer(10 * SAMPLE_RATE, preroll_ms=60)
+        chunk = np.zeros(2400, dtype=np.int16)
+        for i in range(100):
+            jitter.write(chunk)
+            self.now += 0.001 if i % 10 else 0.05
+        self.assertEqual(jitter.target, int(0.06 * SAMPLE_RATE))
+        self.assertEqual(jitter.jitter, 0.0)
+
+    def test_underrun_events(self):
+        """
+        Test that running dry counts as an underrun event only while the response is still arriving.
+        """
+        jitter = JitterBuffer(SAMPLE_RATE, preroll_ms=20)
+        out = np.empty(480, dtype=np.int16)
+        jitter.write(np.ones(480, dtype=np.int16))
+        jitter.read_into(out)
+        jitter.read_into(out)
+
+        self.now += 0.1
+        jitter.write(np.ones(480, dtype=np.int16))
+        self.assertEqual(jitter.underrun_events, 1)
+
+        jitter.read_into(out)
+        jitter.read_into(out)
+        self.now += 2.0
+        jitter.write(np.ones(480, dtype=np.int16))
+        self.assertEqual(jitter.underrun_events, 1, "A new response after a long gap is not an underrun.")
+
+class TestPlaybackFlush(unittest.TestCase):
+
+    def test_request_flush(self):
+        """
+        Test that a flush drops everything written before the consumer's next block, and nothing after.
+        """
+        for ring in (RingBuffer(SAMPLE_RATE), JitterBuffer(SAMPLE_RATE, preroll_ms=10)):
+            out = np.empty(240, dtype=np.int16)
+            ring.write(np.ones(1000, dtype=np.int16))
+            ring.request_flush()
+            ring.write(np.ones(500, dtype=np.int16))
+            self.assertTrue(ring.flush_pending())
+
+            self.assertEqual(ring.read_into(out), 0)
+            self.assertFalse(ring.flush_pending())
+            self.assertEqual(ring.flushed_frames, 1500)
+
+            ring.write(np.full(480, 2, dtype=np.int16))
+            self.assertEqual(ring.read_into(out), 240)
+            np.testing.assert_array_equal(out, 2)
+
+    def test_interrupt(self):
+        """
+        Test that `interrupt` returns once the playback callback applied the flush, with the frames played.
+        """
+        with mock.patch("audio_util.sd.OutputStream"):
+            player = AudioPlayerAsync()
+        block = np.zeros((240, 1), dtype=np.int16)
+
+        async def interrupt():
+            player.add_data(np.ones(1000, dtype=np.int16).tobytes())
+            player.callback(block, 240, None, None)
+            asyncio.get_running_loop().call_later(0.01, player.callback, block, 240, None, None)
+            return await player.interrupt()
+
+        self.assertEqual(asyncio.run(interrupt()), 240)
+        self.assertEqual(player.buffer.available(), 0)
+        self.assertEqual(player.stats()["flushed_frames"], 760)
+        np.testing.assert_array_equal(block, 0)
+
+        player.stop()
+        player.buffer.write(np.ones(1000, dtype=np.int16))
+        self.assertEqual(asyncio.run(player.interrupt()), 240, "A stopped player is cleared without waiting.")
+        self.assertEqual(player.buffer.available(), 0)
+
+class TestMicCapture(unittest.TestCase):
+
+    def test_callback_frames(self):
+        """
+        Test that callback blocks are copied into pooled frames, queued in order and the oldest dropped when full.
+        """
+        async def capture():
+            mic = MicCapture(frame_s=0.01, max_frames=2)
+            mic._loop = asyncio.get_running_loop()
+            indata = np.zeros((mic.frame_size, 1), dtype=np.int16)
+            for value in range(3):
+                indata[:] = value
+                mic._callback(indata, mic.frame_size, None, None)
+            await asyncio.sleep(0)
+            frames = [await mic.read(), await mic.read()]
+            return mic, frames
+
+        mic, frames = asyncio.run(capture())
+        self.assertEqual([int(frame[0]) for frame in frames], [1, 2])
+        self.assertEqual(mic.dropped_frames, 1)
+        self.assertEqual(mic.pool.allocations, 0)
+
+    def test_frames_are_reused(self):
+        """
+        Test that released frames are handed out again, so steady capture does not allocate.
+        """
+        async def capture():
+            mic = MicCapture(frame_s=0.01, max_frames=2)
+            mic._loop = asyncio.get_running_loop()
+            indata = np.ones((mic.frame_size, 1), dtype=np.int16)
+            for _ in range(20):
+                mic._callback(indata, mic.frame_size, None, None)
+                await asyncio.sleep(0)
+                mic.release(await mic.read())
+
+            # a short block is copied rather than taken from the pool
+            mic._callback(indata[:10], 10, None, None)
+            await asyncio.sleep(0)
+            return mic, await mic.read()
+
+        mic, short = asyncio.run(capture())
+        self.assertEqual(mic.pool.acquired, 20)
+        self.assertEqual(mic.pool.allocations, 0)
+        self.assertEqual(len(short), 10)
+
+class TestAudioPacketizer(unittest.TestCase):
+
+    def connection(self):
+        """
+        A connection that records the events sent through it.
+        """
+        class Connection:
+            def __init__(self):
+                self.sent = []
+
+            async def send(self, event):
+                self.sent.append(event)
+
+        return Connection()
+
+    def test_packets(self):
+        """
+        Test that frames are coalesced into packets of `packet_ms` and that `flush` sends the remainder.
+        """
+        frames = [np.full(480, i, dtype=np.int16) for i in range(7)]
+
+        async def send():
+            connection = self.connection()
+            packetizer = AudioPacketizer(connection, packet_ms=100)
+            for frame in frames[:5]:
+                await packetizer.add(frame)
+            sent_full = len(connection.sent)
+            for frame in frames[5:]:
+                await packetizer.add(frame)
+            await packetizer.flush()
+            await packetizer.flush()
+            return connection.sent, sent_full, packetizer.stats()
+
+        sent, sent_full, stats = asyncio.run(send())
+        self.assertEqual(sent_full, 1, "Five 20 ms frames fill a 100 ms packet.")
+        self.assertEqual([message["type"] for message in sent], ["input_audio_buffer.append"] * 2)
+        audio = b"".join(base64.b64decode(message["audio"]) for message in sent)
+        self.assertEqual(audio, np.concatenate(frames).tobytes())
+        self.assertEqual((stats["messages"], stats["audio_bytes"]), (2, 7 * 960))
+
+    def test_oversized_frame(self):
+        """
+        Test that a frame larger than the packet buffer is sent whole, after what was pending.
+        """
+        async def send():
+            connection = self.connection()
+            packetizer = AudioPacketizer(connection, packet_ms=20)
+            await packetizer.add(np.ones(100, dtype=np.int16))
+            await packetizer.add(np.full(4800, 2, dtype=np.int16))
+            return connection.sent
+
+        sent = asyncio.run(send())
+        self.assertEqual([len(base64.b64decode(message["audio"])) for message in sent], [200, 9600])
+
+class ScriptedVad:
+    """
+    A VAD that answers from a list of booleans and records what it was asked to classify.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    def is_speech(self, data, sample_rate):
+        self.calls.append((data, sample_rate))
+        return self.script.pop(0)
+
+class TestVadGate(unittest.TestCase):
+
+    def test_decimates_for_webrtcvad(self):
+        """
+        Test that 24 kHz frames are averaged down to 8 kHz before classification.
+        """
+        gate = VadGate()
+        gate.vad = ScriptedVad([True])
+        frame = np.repeat(np.arange(160, dtype=np.int16), 3)
+        frame[1::3] += 3
+        self.assertTrue(gate.is_speech(frame))
+
+        data, sample_rate = gate.vad.calls[0]
+        self.assertEqual(sample_rate, 8000)
+        np.testing.assert_array_equal(np.frombuffer(data, dtype=np.int16), np.arange(160) + 1)
+
+    def test_preroll_and_hangover(self):
+        """
+        Test that speech is sent with the pre-roll before it and the hangover after it, and silence is held back.
+        """
+        gate = VadGate(preroll_ms=40, hangover_ms=60, frame_ms=20)
+        gate.vad = ScriptedVad([False, False, False, True, False, False, False, False])
+        frames = [np.full(480, i, dtype=np.int16) for i in range(8)]
+
+        sent = [[int(frame[0]) for frame in gate.process(frame)] for frame in frames]
+        self.assertEqual(sent, [[], [], [], [1, 2, 3], [4], [5], [6], []])
+        self.assertFalse(gate.active)
+
+        stats = gate.stats()
+        self.assertAlmostEqual(stats["uploaded_s"], 0.12)
+        self.assertAlmostEqual(stats["suppressed_s"], 0.04)
+        self.assertAlmostEqual(stats["suppressed_ratio"], 0.25)
+
+class TestUtteranceSegmenter(unittest.TestCase):
+
+    def segment(self, script, **options):
+        segmenter = UtteranceSegmenter(ScriptedVad(script), frame_size=2, **options)
+        utterances = [segmenter.push(bytes([i, 0, i, 0])) for i in range(len(script))]
+        return [utterance for utterance in utterances if utterance], segmenter
+
+    def test_utterance_with_preroll(self):
+        """
+        Test that an utterance keeps the pre-roll before its onset and ends after the hangover.
+        """
+        script = [False, False, False, True, True, False, False, False, False]
+        utterances, _ = self.segment(script, preroll_frames=2, hangover_frames=3, min_speech_frames=2)
+        self.assertEqual(len(utterances), 1)
+        utterance = utterances[0]
+        self.assertEqual(utterance.pcm, b"".join(bytes([i, 0, i, 0]) for i in range(1, 8)))
+        self.assertAlmostEqual(utterance.start, 1 * 2 / 16000)
+        self.assertAlmostEqual(utterance.end, 8 * 2 / 16000)
+
+    def test_clicks_are_dropped(self):
+        """
+        Test that speech shorter than `min_speech_frames` is not an utterance.
+        """
+        script = [True, False, False, False]
+        utterances, _ = self.segment(script, hangover_frames=3, min_speech_frames=2)
+        self.assertEqual(utterances, [])
+
+    def test_flush(self):
+        """
+        Test that `flush` closes the utterance still in progress at the end of a recording.
+        """
+        utterances, segmenter = self.segment([True, True, True], preroll_frames=2, min_speech_frames=2)
+        self.assertEqual(utterances, [])
+        utterance = segmenter.flush()
+        self.assertEqual(utterance.pcm, b"".join(bytes([i, 0, i, 0]) for i in range(3)))
+        self.assertIsNone(segmenter.flush())
+
+class TestResampler(unittest.TestCase):
+
+    def test_chunked_matches_one_shot(self):
+        """
+        Test that resampling in chunks of any size gives exactly the one-shot output.
+        """
+        rng = np.random.default_rng(0)
+        for rate, channels in [(16000, 1), (44100, 2), (48000, 1), (8000, 2)]:
+            samples = rng.integers(-10000, 10000, size=rate * channels, dtype=np.int16)
+            one_shot = Resampler(rate, channels).process(samples)
+            self.assertEqual(len(one_shot), -(-SAMPLE_RATE * len(samples) // (rate * channels)))
+
+            resampler = Resampler(rate, channels)
+            chunks, start = [], 0
+            while start < len(samples):
+                chunk = samples[start : start + rng.integers(0, 2000) * channels]
+                chunks.append(resampler.process(chunk))
+                start += len(chunk)
+            np.testing.assert_array_equal(np.concatenate(chunks), one_shot, f"{rate} Hz x {channels}")
+
+    def test_tones(self):
+        """
+        Test that a tone in the pass band keeps its frequency and level and one above the new Nyquist rate is removed.
+        """
+        def tone(frequency, rate):
+            return (10000 * np.sin(2 * np.pi * frequency * np.arange(rate) / rate)).astype(np.int16)
+
+        def rms(samples):
+            return np.sqrt(np.mean(samples[1000:-1000].astype(np.float64) ** 2))
+
+        out = Resampler(16000).process(tone(1000, 16000))
+        self.assertEqual(np.argmax(np.abs(np.fft.rfft(out))), 1000)
+        self.assertAlmostEqual(rms(out) / rms(tone(1000, 16000)), 1, delta=0.02)
+
+        out = Resampler(44100).process(tone(15000, 44100))
+        self.assertLess(rms(out) / rms(tone(15000, 44100)), 0.01)
+
+    def test_downmix_and_passthrough(self):
+        """
+        Test that channels are averaged and 24 kHz mono is passed through unchanged.
+        """
+        stereo = np.array([100, 300, -100, -300, 7, 8], dtype=np.int16)
+        np.testing.assert_array_equal(Resampler(SAMPLE_RATE, 2).process(stereo), [200, -200, 8])
+        mono = np.arange(100, dtype=np.int16)
+        self.assertEqual(convert_pcm16(mono.tobytes(), SAMPLE_RATE, 1), mono.tobytes())
+
+class TestAppendEncoder(unittest.TestCase):
+
+    def test_matches_json_dumps(self):
+        """
+        Test that messages are byte for byte what `json.dumps` of the base64-encoded audio gives.
+        """
+        rng = np.random.default_rng(0)
+        encoder = AppendEncoder(4800)
+        for size in [0, 1, 2, 3, 4, 5, 6, 7, 4799, 4800, 4801, 9601]:
+            audio = rng.integers(0, 256, size=size, dtype=np.uint8)
+            expected = json.dumps(
+                {"type": "input_audio_buffer.append", "audio": base64.b64encode(audio.tobytes()).decode("utf-8")},
+                separators=(",", ":"),
+            )
+            self.assertEqual(bytes(encoder.encode(audio)), expected.encode(), size)
+        self.assertEqual(encoder.resizes, 2)
+
+class TestFramePool(unittest.TestCase):
+
+    def test_reuse(self):
+        """
+        Test that released frames are handed out again and only an empty pool allocates.
+        """
+        pool = FramePool(480, 2)
+        first, second = pool.acquire(), pool.acquire()
+        self.assertEqual(pool.allocations, 0)
+        third = pool.acquire()
+        self.assertEqual((len(third), pool.allocations), (480, 1))
+
+        pool.release(first)
+        pool.release(np.empty(100, dtype=np.int16))
+        self.assertIs(pool.acquire(), first)
+        pool.acquire()
+        self.assertEqual((pool.acquired, pool.allocations), (5, 2), "Frames of another size are not pooled.")
+
+class TestTranscriptPane(unittest.TestCase):
+
+    def test_incremental_updates(self):
+        """
+        Test that deltas are joined per item on refresh, only dirty items are updated and old items are evicted.
+        """
+        class TranscriptApp(App):
+            def compose(self):
+                yield TranscriptPane(max_items=2, max_fps=1)
+
+        async def render():
+            app = TranscriptApp()
+            async with app.run_test():
+                pane = app.query_one(TranscriptPane)
+                pane.append("a", "Hello")
+                pane.append("a", ", [b]world[/b]")
+                pane.append("b", "Second")
+                pane._refresh_items()
+                widget_a, widget_b = pane._items["a"][0], pane._items["b"][0]
+                texts = [str(widget_a.renderable), str(widget_b.renderable)]
+
+                with mock.patch.object(widget_a, "update") as update_a, mock.patch.object(widget_b, "update") as update_b:
+                    pane.append("b", " item")
+                    pane._refresh_items()
+                    pane._refresh_items()
+                    updates = (update_a.call_count, update_b.call_count, str(update_b.call_args[0][0]))
+
+                pane.append("c", "Third")
+                return texts, updates, list(pane._items), pane._items["b"][1]
+
+        texts, updates, items, chunks = asyncio.run(render())
+        self.assertEqual(texts, ["Hello, [b]world[/b]", "Second"], "Brackets should not be parsed as markup.")
+        self.assertEqual(updates, (0, 1, "Second item"))
+        self.assertEqual(items, ["b", "c"])
+        self.assertEqual(chunks, ["Second item"], "Refreshed deltas are collapsed.")
+
+class TestRealtimeApp(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ToolExecutor(max_workers=2, timeout_s=5, tool_timeouts={"slow": 0.05})
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def blocked(self):
+        self.release.wait(5)
+        return "late"
+
+    def test_timeout_payload(self):
+        """
+        Test that a timed out tool call answers the model with an error instead of raising.
+        """
+        app = mock.Mock(tool_executor=self.executor, handle_functions=lambda name, args, prefetched: self.blocked())
+        output = asyncio.run(RealtimeApp.run_tool(app, "slow", '{"date": "2025-01-15"}'))
+        self.assertEqual(output, "Error: slow timed out after 0.1s.")
+
+    def test_only_reads_start_early(self):
+        """
+        Test that only tools without side effects are started before their response completes.
+        """
+        names = {tool["name"] for tool in tools}
+        self.assertLessEqual(READ_ONLY_TOOLS, names)
+        self.assertFalse(READ_ONLY_TOOLS & {"book_appointment", "update_appointment", "cancel_appointment"})
+
+        app = mock.Mock(call_names={"c1": "book_appointment", "c2": "find_earliest_slot"}, pending_tools={})
+        app._timed_tool = mock.AsyncMock(return_value=("", 0.0, 0.0))
+
+        async def arguments_done():
+            for call_id in ("c1", "c2"):
+                RealtimeApp.handle_arguments_done(app, mock.Mock(call_id=call_id, arguments="{}"))
+            await asyncio.gather(*app.pending_tools.values())
+
+        asyncio.run(arguments_done())
+        self.assertEqual(list(app.pending_tools), ["c2"])
+
+    def test_response_done_runs_calls_together(self):
+        """
+        Test that the calls of one response run side by side and are answered in call order with one follow-up.
+        """
+        durations = {"book_appointment": 0.3, "find_earliest_slot": 0.1}
+
+        def handle_functions(name, args, prefetched):
+            time.sleep(durations[name])
+            return f"{name} done"
+
+        app = mock.Mock(tool_executor=self.executor, handle_functions=handle_functions, pending_tools={}, call_names={}, head_start=HeadStartStats())
+        app.prefetcher.take = mock.AsyncMock(return_value=None)
+        app._timed_tool = lambda *args: RealtimeApp._timed_tool(app, *args)
+        app.run_tool = lambda **kwargs: RealtimeApp.run_tool(app, **kwargs)
+        connection = mock.Mock()
+        connection.conversation.item.create = mock.AsyncMock()
+        connection.response.create = mock.AsyncMock()
+        app._get_connection = mock.AsyncMock(return_value=connection)
+
+        calls = [SimpleNamespace(type="function_call", call_id=f"c{i}", name=name, arguments="{}") for i, name in enumerate(durations)]
+        event = mock.Mock(response=mock.Mock(id="r1", status="completed", output=calls))
+        started = time.perf_counter()
+        asyncio.run(RealtimeApp.handle_response_done(app, event))
+        elapsed = time.perf_counter() - started
+
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 0.3 + 0.1, "The calls should run at the same time, not one after the other.")
+        outputs = [call.kwargs["item"] for call in connection.conversation.item.create.await_args_list]
+        self.assertEqual([(item["call_id"], item["output"]) for item in outputs], [("c0", "book_appointment done"), ("c1", "find_earliest_slot done")])
+        connection.response.create.assert_awaited_once_with()
+        self.assertEqual(connection.mock_calls[-1], mock.call.response.create(), "The follow-up should come after every output.")
+
+    def test_reads_overlap_a_write(self):
+        """
+        Test that read-only tools run side by side while another call holds the write lock.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pool = AppointmentDBPool(db_name=os.path.join(directory.name, "hospital.db"), size=3)
+        self.addCleanup(pool.close)
+        with pool.checkout() as handler:
+            handler.add_doctor(name="John Smith", specialization="Cardiology")
+        app = mock.Mock(db_pool=pool)
+
+        # each read waits for the other, so both finish only if they run at the same time
+        both_reading = threading.Barrier(2)
+        get_available_appointments = AppointmentDBHandler.get_available_appointments
+        find_earliest_slot = AppointmentDBHandler.find_earliest_slot
+
+        def together(read):
+            def wrapper(*args, **kwargs):
+                both_reading.wait(timeout=2)
+                return read(*args, **kwargs)
+            return wrapper
+
+        results = {}
+
+        def call(name, args):
+            results[name] = RealtimeApp.handle_functions(app, name, args)
+
+        with mock.patch.object(AppointmentDBHandler, "get_available_appointments", together(get_available_appointments)), \
+             mock.patch.object(AppointmentDBHandler, "find_earliest_slot", together(find_earliest_slot)):
+            with pool.checkout() as writer, writer.transaction():
+                writer.book_appointment(patient_id="P1", doctor_name="John Smith", specialization="Cardiology", appointment_date="2030-01-15 10:00:00")
+                threads = [
+                    threading.Thread(target=call, args=("list_availabe_slots", '{"doctor_name": "John Smith", "specialization": "Cardiology", "date": "2030-01-15"}')),
+                    threading.Thread(target=call, args=("find_earliest_slot", '{"specialization": "Cardiology", "days": 2}'))
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(5)
+                self.assertTrue(writer.connection.in_transaction, "Reads should finish before the write commits.")
+
+        self.assertIn("datetime.datetime(2030, 1, 15, 10, 0)", results["list_availabe_slots"], "Uncommitted booking should not be visible.")
+        self.assertIn("Dr. John Smith", results["find_earliest_slot"])
+
+if __name__ == "__main__":
+    unittest.main()
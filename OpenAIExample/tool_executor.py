@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+TOOL_WORKERS = 4
+TOOL_TIMEOUT_S = 10.0
+
+
+class ToolTimeoutError(TimeoutError):
+    """A tool call did not finish within its timeout."""
+
+    def __init__(self, name: str, timeout_s: float):
+        super().__init__(f"{name} timed out after {timeout_s:.1f}s")
+        self.name = name
+        self.timeout_s = timeout_s
+
+
+class ToolStats:
+    """Queue wait and execution time of the calls made to one tool."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.exec_s = 0.0
+        self.max_exec_s = 0.0
+
+    def record(self, wait: float, elapsed: float) -> None:
+        self.calls += 1
+        self.wait_s += wait
+        self.max_wait_s = max(self.max_wait_s, wait)
+        self.exec_s += elapsed
+        self.max_exec_s = max(self.max_exec_s, elapsed)
+
+    def summary(self) -> dict[str, float]:
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "mean_wait_ms": self.wait_s / calls * 1000,
+            "max_wait_ms": self.max_wait_s * 1000,
+            "mean_exec_ms": self.exec_s / calls * 1000,
+            "max_exec_ms": self.max_exec_s * 1000,
+        }
+
+
+class HeadStartStats:
+    """How much of each turn's tool time was hidden by starting tools before `response.done`.
+
+    Per turn, the wait without the head start is the slowest tool's execution time and
+    the wait with it is whatever was still left of any tool when the response completed.
+    """
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.calls = 0
+        self.early_calls = 0
+        self.saved_s = 0.0
+        self.max_saved_s = 0.0
+        self.remaining_s = 0.0
+
+    def record(self, done_at: float, timings: list[tuple[float, float]]) -> float:
+        """Record a turn from the (started, finished) perf_counter pair of each call, returns the time saved."""
+        full = max(finished - started for started, finished in timings)
+        remaining = max(max(0.0, finished - max(started, done_at)) for started, finished in timings)
+        saved = full - remaining
+
+        self.turns += 1
+        self.calls += len(timings)
+        self.early_calls += sum(started < done_at for started, _ in timings)
+        self.saved_s += saved
+        self.max_saved_s = max(self.max_saved_s, saved)
+        self.remaining_s += remaining
+        return saved
+
+    def summary(self) -> dict[str, float]:
+        turns = self.turns or 1
+        return {
+            "turns": self.turns,
+            "calls": self.calls,
+            "early_calls": self.early_calls,
+            "mean_saved_ms": self.saved_s / turns * 1000,
+            "max_saved_ms": self.max_saved_s * 1000,
+            "mean_remaining_ms": self.remaining_s / turns * 1000,
+        }
+
+
+class ToolExecutor:
+    """Runs blocking tool calls (sqlite queries and commits) on a bounded thread pool.
+
+    `run` returns an awaitable so the event loop keeps dispatching audio deltas and
+    uploading mic frames while a tool works. A call that exceeds its timeout raises
+    `ToolTimeoutError`; its thread can't be interrupted and finishes in the background,
+    holding one of the `max_workers` slots until it does.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = TOOL_WORKERS,
+        timeout_s: float = TOOL_TIMEOUT_S,
+        tool_timeouts: dict[str, float] | None = None,
+    ):
+        self.timeout_s = timeout_s
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.stats: dict[str, ToolStats] = {}
+
+    def _stats(self, name: str) -> ToolStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ToolStats()
+        return stats
+
+    async def run(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call `fn(*args, **kwargs)` on a worker thread, `name` keys the timeout and the stats."""
+        loop = asyncio.get_running_loop()
+        stats = self._stats(name)
+        timeout_s = self.tool_timeouts.get(name, self.timeout_s)
+        submitted = time.perf_counter()
+
+        def call() -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.record(started - submitted, time.perf_counter() - started)
+
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout_s)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            log.warning("Tool %s timed out after %.1f s", name, timeout_s)
+            raise ToolTimeoutError(name, timeout_s) from None
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,7 +1,16 @@
+import asyncio
 import pyaudio
 import base64
 import webrtcvad
-import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+# Audio stream parameters
+CHUNK = 320          # Frame size for VAD (20ms for 16kHz audio)
+FORMAT = pyaudio.paInt16  # 16-bit PCM
+CHANNELS = 1          # Mono audio
+RATE = 16000          # Sampling rate (16 kHz, required for WebRTC VAD)
 
 def base64_encode_audio(data):
     """
@@ -15,51 +24,155 @@ def is_speech(data, vad, sample_rate=16000):
     """
     return vad.is_speech(data, sample_rate)
 
-def record_and_encode_with_vad():
+@dataclass
+class Utterance:
     """
-    Record audio and encode it to Base64 only when speech is detected.
+    A complete utterance of PCM16 audio, timestamps are seconds since capture started.
     """
-    # Audio stream parameters
-    CHUNK = 320          # Frame size for VAD (20ms for 16kHz audio)
-    FORMAT = pyaudio.paInt16  # 16-bit PCM
-    CHANNELS = 1          # Mono audio
-    RATE = 16000          # Sampling rate (16 kHz, required for WebRTC VAD)
+    pcm: bytes
+    start: float
+    end: float
 
-    # Initialize PyAudio and WebRTC VAD
-    audio = pyaudio.PyAudio()
-    vad = webrtcvad.Vad()
-    vad.set_mode(2)  # Aggressiveness mode: 0 (least aggressive) to 3 (most aggressive)
+class UtteranceSegmenter:
+    """
+    Split a stream of fixed-size PCM16 frames into utterances.
+
+    Frames seen while idle are kept in a pre-roll ring so the onset of the next utterance
+    is never lost, and an utterance only ends after `hangover_frames` of silence.
+    Timestamps are derived from the frame count, so they stay sample accurate even when
+    the consumer runs behind the microphone.
+    """
+
+    def __init__(self, vad, sample_rate=RATE, frame_size=CHUNK, preroll_frames=15, hangover_frames=25, min_speech_frames=3):
+        self.vad = vad
+        self.sample_rate = sample_rate
+        self.frame_duration = frame_size / sample_rate
+        self.hangover_frames = hangover_frames
+        self.min_speech_frames = min_speech_frames
+
+        self._preroll = deque(maxlen=preroll_frames)
+        self._frames = []
+        self._frame_index = 0
+        self._start_frame = 0
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def push(self, frame: bytes) -> Optional[Utterance]:
+        """
+        Feed one frame, returns an utterance when this frame completes one.
+        """
+        index = self._frame_index
+        self._frame_index += 1
+        speech = is_speech(frame, self.vad, sample_rate=self.sample_rate)
+
+        if not self._frames:
+            if speech:
+                self._start_frame = index - len(self._preroll)
+                self._frames = [*self._preroll, frame]
+                self._preroll.clear()
+                self._speech_frames = 1
+                self._silent_frames = 0
+            else:
+                self._preroll.append(frame)
+            return None
+
+        self._frames.append(frame)
+        if speech:
+            self._speech_frames += 1
+            self._silent_frames = 0
+            return None
+
+        self._silent_frames += 1
+        if self._silent_frames < self.hangover_frames:
+            return None
+        return self._finish()
+
+    def flush(self) -> Optional[Utterance]:
+        """
+        Close the utterance in progress, if any, e.g. at the end of a recording.
+        """
+        if not self._frames:
+            return None
+        return self._finish()
+
+    def _finish(self) -> Optional[Utterance]:
+        frames = self._frames
+        self._frames = []
+
+        # clicks and pops that only trip the VAD for a frame or two are not utterances
+        if self._speech_frames < self.min_speech_frames:
+            return None
+
+        end_frame = self._start_frame + len(frames)
+        return Utterance(
+            pcm=b"".join(frames),
+            start=self._start_frame * self.frame_duration,
+            end=end_frame * self.frame_duration,
+        )
+
+async def capture_frames(rate=RATE, chunk=CHUNK) -> AsyncIterator[bytes]:
+    """
+    Yield microphone frames delivered by PyAudio's callback thread.
+
+    The callback only hands each frame to the event loop, so capture never waits on the
+    consumer and no audio is dropped while utterances are being processed.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def callback(in_data, frame_count, time_info, status):
+        loop.call_soon_threadsafe(queue.put_nowait, in_data)
+        return (None, pyaudio.paContinue)
 
-    # Open the audio stream
+    audio = pyaudio.PyAudio()
     stream = audio.open(format=FORMAT,
                         channels=CHANNELS,
-                        rate=RATE,
+                        rate=rate,
                         input=True,
-                        frames_per_buffer=CHUNK)
-
-    print("Recording... Speak to start recording. Silence will pause recording.")
-
+                        frames_per_buffer=chunk,
+                        stream_callback=callback)
     try:
         while True:
-            # Read a chunk of audio data
-            audio_data = stream.read(CHUNK, exception_on_overflow=False)
-
-            # Check for speech
-            if is_speech(audio_data, vad, sample_rate=RATE):
-                print("Speech detected!")
-                encoded_audio = base64_encode_audio(audio_data)
-                print(f"Base64 Encoded Audio: {encoded_audio[:60]}...")  # Print part of the encoded data
-            else:
-                print("Silence detected. Pausing...")
-                time.sleep(0.2)  # Small delay to prevent excessive CPU usage
-
-    except KeyboardInterrupt:
-        print("\nStopped recording.")
+            yield await queue.get()
     finally:
-        # Stop and close the audio stream
         stream.stop_stream()
         stream.close()
         audio.terminate()
 
+async def segment_utterances(frames: AsyncIterator[bytes], vad=None, **segmenter_options) -> AsyncIterator[Utterance]:
+    """
+    Yield complete utterances from any async source of 20ms PCM16 frames, a live
+    microphone via `capture_frames()` or frames read from a recording.
+    """
+    if vad is None:
+        vad = webrtcvad.Vad()
+        vad.set_mode(2)  # Aggressiveness mode: 0 (least aggressive) to 3 (most aggressive)
+
+    segmenter = UtteranceSegmenter(vad, **segmenter_options)
+    async for frame in frames:
+        utterance = segmenter.push(frame)
+        if utterance:
+            yield utterance
+
+    utterance = segmenter.flush()
+    if utterance:
+        yield utterance
+
+async def _encode_utterances():
+    async for utterance in segment_utterances(capture_frames()):
+        encoded_audio = base64_encode_audio(utterance.pcm)
+        print(f"Utterance {utterance.start:.2f}s - {utterance.end:.2f}s: {len(encoded_audio)} Base64 characters")
+
+def record_and_encode_with_vad():
+    """
+    Record audio and encode every complete utterance to Base64.
+    """
+    print("Recording... Speak to start an utterance. Silence ends it.")
+
+    try:
+        asyncio.run(_encode_utterances())
+    except KeyboardInterrupt:
+        print("\nStopped recording.")
+
 if __name__ == "__main__":
-    record_and_encode_with_vad()
\ No newline at end of file
+    record_and_encode_with_vad()
@@ -3,6 +3,8 @@ from  openai import AsyncOpenAI
 
 import base64
 
+from OpenAIExample.audio_util import AudioCache, send_audio_file
+
 def encode_mp3_to_base64(file_path):
     """
     Encodes an MP3 file to a Base64 string.
@@ -88,21 +90,17 @@ async def main():
             }
         )
 
-        await connection.conversation.item.create(
-            item={
-                "type": "message",
-                "role": "user",
-                "content": [{"type": "input_audio_buffer.append", "audio": encode_mp3_to_base64("input_1.mp3")}],
-            }
-        )
+        # commit each recording ourselves instead of letting server VAD cut it into turns
+        await connection.session.update(session={'turn_detection': None})
 
-        await connection.conversation.item.create(
-            item={
-                "type": "message",
-                "role": "user",
-                "content": [{"type": "input_audio_buffer.append", "audio": encode_mp3_to_base64("affirmation.mp3")}],
-            }
-        )
+        # decode and upload incrementally, so memory stays flat for arbitrarily long recordings,
+        # the cache lets repeated runs skip decoding the same clips
+        cache = AudioCache()
+        await send_audio_file(connection, "audio_files/input_1.mp3", realtime=False, cache=cache)
+        await connection.input_audio_buffer.commit()
+
+        await send_audio_file(connection, "audio_files/affirmation.mp3", realtime=False, cache=cache)
+        await connection.input_audio_buffer.commit()
 
         await connection.response.create()
 